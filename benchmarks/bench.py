@@ -0,0 +1,366 @@
+#!/usr/bin/env python
+"""
+Benchmarks riakasaurus against an in-process fake Riak node (see
+fakeriak.py), or against a real one with --host.
+
+Measures throughput and latency percentiles of the common operations over
+both transports, for several connection pool sizes and payload sizes:
+
+    python benchmarks/bench.py
+    python benchmarks/bench.py --transports pbc --ops get,put --pools 1,50
+    python benchmarks/bench.py --decode
+
+PBC runs are repeated with the hand written response decoders
+(PBCTransport.FAST_DECODING) and with the generated protobuf code, see
+--decoders. --decode only times decoding PBC responses with each.
+
+--memory reports the memory taken per RiakObject, RiakLink and
+RiakIndexEntry instance. It measures whichever riakasaurus is imported, so
+checking out an older riakasaurus/ compares revisions.
+
+The fake node shares the reactor (and the CPU) with the client, so the
+numbers are meant for comparing revisions of the client, not for sizing a
+cluster.
+
+"""
+
+import os
+import sys
+import json
+import time
+import resource
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                '..'))
+
+from twisted.internet import defer, reactor
+from twisted.python import usage
+
+from riakasaurus import riak, transport
+from riakasaurus.mapreduce import RiakLink
+from riakasaurus.riak_index_entry import RiakIndexEntry
+from riakasaurus.transport import pbc
+from riakasaurus.transport.pbc import riak_kv_pb2
+
+import fakeriak
+
+OPERATIONS = ('put', 'get', 'delete', '2i', 'keys', 'mapred')
+# these operations touch many objects each, run fewer of them
+HEAVY = {'keys': 10, 'mapred': 10}
+BUCKET = 'riakasaurus.bench'
+# objects in the bucket for list keys, and inputs per MapReduce job
+KEYS = 1000
+MAPRED_INPUTS = 10
+DECODERS = ('fast', 'protobuf')
+# keys per list keys response timed by --decode
+KEYS_CHUNK = 500
+
+HEADER = '%-5s %-8s %-7s %5s %6s %6s %10s %8s %8s %8s %8s'
+ROW = '%-5s %-8s %-7s %5d %6d %6d %10.1f %8.2f %8.2f %8.2f %8.2f'
+DECODE_HEADER = '%-5s %6s %-8s %10s'
+DECODE_ROW = '%-5s %6d %-8s %10.1f'
+MEMORY_HEADER = '%-15s %9s %12s'
+MEMORY_ROW = '%-15s %9d %12.1f'
+
+
+class Options(usage.Options):
+    optParameters = [
+        ['transports', 't', 'pbc,http', 'transports to benchmark'],
+        ['ops', 'o', ','.join(OPERATIONS), 'operations to benchmark'],
+        ['pools', 'p', '1,10', 'connection pool sizes'],
+        ['sizes', 's', '100,10000', 'payload sizes in bytes'],
+        ['decoders', 'd', ','.join(DECODERS), 'PBC response decoders'],
+        ['requests', 'n', 2000, 'requests per run', int],
+        ['concurrency', 'c', 50, 'requests in flight', int],
+        ['host', None, None, 'benchmark a real Riak node on this host'],
+        ['pbc-port', None, 8087, 'PBC port of --host', int],
+        ['http-port', None, 8098, 'HTTP port of --host', int],
+        ['json', None, None, 'also write the results to this file'],
+        ['instances', None, 200000, 'instances created by --memory', int],
+    ]
+    optFlags = [
+        ['decode', None, 'only time decoding PBC responses'],
+        ['memory', None, 'only measure the memory taken per instance'],
+    ]
+
+    def postOptions(self):
+        for option in ('transports', 'ops', 'decoders'):
+            self[option] = self[option].split(',')
+        for option in ('pools', 'sizes'):
+            self[option] = [int(v) for v in self[option].split(',')]
+        for op in self['ops']:
+            if op not in OPERATIONS:
+                raise usage.UsageError('unknown operation %s' % op)
+        for decoder in self['decoders']:
+            if decoder not in DECODERS:
+                raise usage.UsageError('unknown decoder %s' % decoder)
+
+
+def percentile(latencies, p):
+    """
+    latencies has to be sorted
+    """
+    if not latencies:
+        return 0.0
+    return latencies[min(int(len(latencies) * p / 100.0),
+                         len(latencies) - 1)]
+
+
+def makeClient(name, pool, host, port, decoder='fast'):
+    """
+    A client using transport name with a pool of pool connections
+    """
+    if name == 'pbc':
+        cls = type('PBCTransport', (transport.PBCTransport,),
+                   {'MAX_TRANSPORTS': pool,
+                    'FAST_DECODING': decoder == 'fast'})
+    else:
+        cls = type('HTTPTransport', (transport.HTTPTransport,),
+                   {'MAX_PERSISTENT_PER_HOST': pool})
+    client = riak.RiakClient(host=host, port=port, transport=cls,
+                             client_id='bench', server_version='1.4.0')
+    if name == 'http':
+        client.get_transport().set_client_id(client.get_client_id())
+    return client
+
+
+class Run(object):
+    """
+    One operation against one client configuration
+    """
+
+    def __init__(self, client, op, size, requests, concurrency):
+        self.client = client
+        self.bucket = client.bucket(BUCKET)
+        self.op = op
+        self.data = {'payload': 'x' * size}
+        self.requests = max(requests / HEAVY.get(op, 1), 1)
+        self.concurrency = min(concurrency, self.requests)
+        self.latencies = []
+
+    @defer.inlineCallbacks
+    def populate(self, count, indexed=False):
+        for i in range(count):
+            obj = self.bucket.new('key%d' % i, self.data)
+            if indexed:
+                obj.add_index('n_int', i % 100)
+            yield obj.store(return_body=False)
+
+    def prepare(self):
+        if self.op in ('get', 'delete'):
+            return self.populate(self.requests)
+        elif self.op == '2i':
+            return self.populate(KEYS, indexed=True)
+        elif self.op in ('keys', 'mapred'):
+            return self.populate(KEYS)
+        return defer.succeed(None)
+
+    def request(self, i):
+        key = 'key%d' % i
+        if self.op == 'put':
+            return self.bucket.new(key, self.data).store(return_body=False)
+        elif self.op == 'get':
+            return self.bucket.get(key)
+        elif self.op == 'delete':
+            return self.bucket.new(key).delete()
+        elif self.op == '2i':
+            return self.bucket.get_index('n_int', i % 100)
+        elif self.op == 'keys':
+            return self.bucket.get_keys()
+        elif self.op == 'mapred':
+            mr = self.client.add(BUCKET, 'key%d' % (i % KEYS))
+            for j in range(1, MAPRED_INPUTS):
+                mr.add(BUCKET, 'key%d' % ((i + j) % KEYS))
+            return mr.map('Riak.mapValuesJson').run()
+
+    @defer.inlineCallbacks
+    def worker(self, requests):
+        for i in requests:
+            started = time.time()
+            yield self.request(i)
+            self.latencies.append(time.time() - started)
+
+    @defer.inlineCallbacks
+    def run(self):
+        yield self.prepare()
+        requests = iter(range(self.requests))
+        started = time.time()
+        yield defer.gatherResults([self.worker(requests)
+                                   for i in range(self.concurrency)])
+        elapsed = time.time() - started
+
+        latencies = sorted(self.latencies)
+        defer.returnValue({
+            'op': self.op,
+            'requests': self.requests,
+            'ops_per_sec': self.requests / elapsed,
+            'p50': percentile(latencies, 50),
+            'p90': percentile(latencies, 90),
+            'p99': percentile(latencies, 99),
+            'max': latencies[-1],
+        })
+
+
+@defer.inlineCallbacks
+def runOne(options, name, decoder, pool, size, op, host, port):
+    client = makeClient(name, pool, host, port, decoder)
+    yield cleanBucket(client)
+    result = yield Run(client, op, size, options['requests'],
+                       options['concurrency']).run()
+    yield client.get_transport().quit()
+    result.update(transport=name, decoder=decoder, pool=pool, size=size)
+    print ROW % (name, decoder, op, pool, size, result['requests'],
+                 result['ops_per_sec'], result['p50'] * 1000,
+                 result['p90'] * 1000, result['p99'] * 1000,
+                 result['max'] * 1000)
+    defer.returnValue(result)
+
+
+@defer.inlineCallbacks
+def cleanBucket(client):
+    bucket = client.bucket(BUCKET)
+    keys = yield bucket.get_keys()
+    for key in keys:
+        yield bucket.new(key).delete()
+
+
+def decodeMessages(sizes):
+    """
+    (name, size, code, data) of typical responses, data as received
+    """
+    messages = []
+    for size in sizes:
+        resp = riak_kv_pb2.RpbGetResp(vclock='a85hYGBgzGDKBVIcR4M2cgczH7H')
+        content = resp.content.add(value='x' * size,
+                                   content_type='application/json',
+                                   vtag='4PaxWnLrN6gX6ne8mAjvmQ',
+                                   last_mod=1380000000, last_mod_usecs=1234)
+        content.usermeta.add(key='colour', value='red')
+        content.indexes.add(key='n_int', value='7')
+        messages.append(('get', size, pbc.MSG_CODE_GET_RESP, resp))
+    resp = riak_kv_pb2.RpbListKeysResp(
+        keys=['key%d' % i for i in range(KEYS_CHUNK)])
+    messages.append(('keys', KEYS_CHUNK, pbc.MSG_CODE_LIST_KEYS_RESP, resp))
+    return [(name, size, code, chr(code) + resp.SerializeToString())
+            for name, size, code, resp in messages]
+
+
+def benchmarkDecoding(options):
+    print DECODE_HEADER % ('msg', 'size', 'decoder', 'us/msg')
+    results = []
+    protocol = pbc.RiakPBC()
+    for name, size, code, data in decodeMessages(options['sizes']):
+        for decoder in options['decoders']:
+            protocol.fastDecoding = decoder == 'fast'
+            started = time.time()
+            for i in xrange(options['requests']):
+                protocol._parse(code, data)
+            elapsed = (time.time() - started) / options['requests']
+            results.append({'msg': name, 'size': size, 'decoder': decoder,
+                            'us': elapsed * 1e6})
+            print DECODE_ROW % (name, size, decoder, elapsed * 1e6)
+    writeResults(options, results)
+
+
+def maxRSS():
+    """
+    The peak resident memory of this process in bytes
+    """
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if sys.platform == 'darwin':
+        return rss
+    return rss * 1024
+
+
+def benchmarkMemory(options):
+    """
+    Keeps all the instances alive so that the peak resident memory grows
+    by what each batch takes.
+    """
+    client = riak.RiakClient(client_id='bench')
+    bucket = client.bucket(BUCKET)
+    count = options['instances']
+    keys = ['key%d' % i for i in xrange(count)]
+    makers = [
+        # including its metadata dict
+        ('RiakObject', lambda key: bucket.new(key)),
+        ('RiakLink', lambda key: RiakLink(BUCKET, key, 'tag')),
+        ('RiakIndexEntry', lambda key: RiakIndexEntry('field_bin', key)),
+    ]
+
+    print MEMORY_HEADER % ('class', 'instances', 'bytes/inst')
+    results = []
+    alive = []
+    for name, make in makers:
+        before = maxRSS()
+        alive.append([make(key) for key in keys])
+        perInstance = float(maxRSS() - before) / count
+        results.append({'class': name, 'instances': count,
+                        'bytes': perInstance})
+        print MEMORY_ROW % (name, count, perInstance)
+    writeResults(options, results)
+
+
+@defer.inlineCallbacks
+def benchmark(options):
+    if options['host']:
+        host = options['host']
+        ports = {'pbc': options['pbc-port'], 'http': options['http-port']}
+    else:
+        host = '127.0.0.1'
+        store, pbcPort, httpPort = fakeriak.listen()
+        ports = {'pbc': pbcPort.getHost().port,
+                 'http': httpPort.getHost().port}
+
+    print HEADER % ('trans', 'decoder', 'op', 'pool', 'size', 'reqs',
+                    'ops/sec', 'p50 ms', 'p90 ms', 'p99 ms', 'max ms')
+    results = []
+    for name in options['transports']:
+        decoders = name == 'pbc' and options['decoders'] or ['-']
+        for decoder in decoders:
+            for pool in options['pools']:
+                for size in options['sizes']:
+                    for op in options['ops']:
+                        result = yield runOne(options, name, decoder, pool,
+                                              size, op, host, ports[name])
+                        results.append(result)
+    writeResults(options, results)
+
+
+def writeResults(options, results):
+    if options['json']:
+        with open(options['json'], 'w') as f:
+            json.dump(results, f, indent=2)
+
+
+def main():
+    options = Options()
+    try:
+        options.parseOptions()
+    except usage.UsageError, e:
+        print '%s: %s' % (sys.argv[0], e)
+        print options
+        sys.exit(1)
+
+    if options['decode']:
+        benchmarkDecoding(options)
+        return
+    if options['memory']:
+        benchmarkMemory(options)
+        return
+
+    def done(result):
+        if reactor.running:
+            reactor.stop()
+        return result
+
+    def run():
+        benchmark(options).addErrback(
+            lambda f: f.printTraceback()).addBoth(done)
+
+    reactor.callWhenRunning(run)
+    reactor.run()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,409 @@
+"""
+.. module:: fakeriak.py
+
+An in-process stand-in for a Riak node, speaking enough of the Protocol
+Buffers and HTTP interfaces for the benchmarks: ping, server info,
+get/put/delete of objects (including conditional gets and secondary
+indexes), key and bucket listing, bucket properties, secondary index
+queries and MapReduce.
+
+MapReduce does not run any code: map phases return the JSON decoded
+values of their inputs (like Riak.mapValuesJson), reduce phases pass
+their inputs through.
+
+"""
+
+import json
+import itertools
+import urllib
+from struct import pack, unpack
+
+from twisted.internet import protocol, reactor
+from twisted.protocols.basic import Int32StringReceiver
+from twisted.web import resource, server
+
+from riakasaurus.transport import pbc
+
+SERVER_VERSION = '1.4.0'
+# keys per list keys / MapReduce response message
+CHUNK_SIZE = 100
+
+
+class Store(object):
+    """
+    The objects of the fake node, by bucket and key. Every object is a
+    dict of value, content_type, usermeta, indexes, vtag and vclock.
+    """
+
+    def __init__(self):
+        self.buckets = {}
+        self.props = {}
+        self._counter = itertools.count(1)
+
+    def get(self, bucket, key):
+        return self.buckets.get(bucket, {}).get(key)
+
+    def put(self, bucket, key, obj):
+        if key is None:
+            key = 'k%d' % next(self._counter)
+        obj['vtag'] = 'vt%d' % next(self._counter)
+        obj['vclock'] = 'vc%d' % next(self._counter)
+        self.buckets.setdefault(bucket, {})[key] = obj
+        return key, obj
+
+    def delete(self, bucket, key):
+        self.buckets.get(bucket, {}).pop(key, None)
+
+    def keys(self, bucket):
+        return self.buckets.get(bucket, {}).keys()
+
+    def index(self, bucket, index, start, end=None):
+        convert = index.endswith('_int') and int or str
+        start = convert(start)
+        if end is not None:
+            end = convert(end)
+
+        keys = []
+        for key, obj in self.buckets.get(bucket, {}).iteritems():
+            for field, value in obj['indexes']:
+                if field != index:
+                    continue
+                value = convert(value)
+                if (value == start if end is None else
+                    start <= value <= end):
+                    keys.append(key)
+                    break
+        return keys
+
+    def mapred(self, job):
+        """
+        run job and return the results of its last phase
+        """
+        inputs = job['inputs']
+        if isinstance(inputs, basestring):
+            inputs = [[inputs, key] for key in self.keys(inputs)]
+        results = [input[:2] for input in inputs]
+        for phase in job.get('query', []):
+            if 'map' in phase:
+                values = []
+                for bucket, key in results:
+                    obj = self.get(bucket, key)
+                    if obj is not None:
+                        values.append(json.loads(obj['value']))
+                results = values
+        return results
+
+
+class FakeRiakPBC(Int32StringReceiver):
+    MAX_LENGTH = 64 * 1024 * 1024
+
+    def stringReceived(self, data):
+        code = unpack('B', data[:1])[0]
+        handler = self.handlers.get(code)
+        if handler is None:
+            return self.send(pbc.MSG_CODE_ERROR_RESP, pbc.RpbErrorResp(
+                errmsg='unsupported message %d' % code, errcode=1))
+        handler(self, self.factory.store, data[1:])
+
+    def send(self, code, message=None):
+        data = pack('B', code)
+        if message is not None:
+            data += message.SerializeToString()
+        self.sendString(data)
+
+    def parse(self, cls, data):
+        message = cls()
+        message.ParseFromString(data)
+        return message
+
+    def fillContent(self, content, obj, head=False):
+        if not head:
+            content.value = obj['value']
+        content.content_type = obj['content_type']
+        content.vtag = obj['vtag']
+        content.last_mod = 1
+        for key, value in obj['usermeta']:
+            content.usermeta.add(key=key, value=value)
+        for key, value in obj['indexes']:
+            content.indexes.add(key=key, value=value)
+
+    def ping(self, store, data):
+        self.send(pbc.MSG_CODE_PING_RESP)
+
+    def setClientId(self, store, data):
+        self.send(pbc.MSG_CODE_SET_CLIENT_ID_RESP)
+
+    def getServerInfo(self, store, data):
+        self.send(pbc.MSG_CODE_GET_SERVER_INFO_RESP, pbc.RpbGetServerInfoResp(
+            node='fake@127.0.0.1', server_version=SERVER_VERSION))
+
+    def get(self, store, data):
+        req = self.parse(pbc.RpbGetReq, data)
+        resp = pbc.RpbGetResp()
+        obj = store.get(req.bucket, req.key)
+        if obj is not None:
+            resp.vclock = obj['vclock']
+            if req.HasField('if_modified') and \
+                    req.if_modified == obj['vclock']:
+                resp.unchanged = True
+            else:
+                self.fillContent(resp.content.add(), obj, req.head)
+        self.send(pbc.MSG_CODE_GET_RESP, resp)
+
+    def put(self, store, data):
+        req = self.parse(pbc.RpbPutReq, data)
+        key = req.key if req.HasField('key') else None
+        key, obj = store.put(req.bucket, key, {
+            'value': req.content.value,
+            'content_type': req.content.content_type,
+            'usermeta': [(p.key, p.value) for p in req.content.usermeta],
+            'indexes': [(p.key, p.value) for p in req.content.indexes],
+        })
+        resp = pbc.RpbPutResp()
+        if not req.HasField('key'):
+            resp.key = key
+        if req.return_body:
+            resp.vclock = obj['vclock']
+            self.fillContent(resp.content.add(), obj)
+        self.send(pbc.MSG_CODE_PUT_RESP, resp)
+
+    def delete(self, store, data):
+        req = self.parse(pbc.RpbDelReq, data)
+        store.delete(req.bucket, req.key)
+        self.send(pbc.MSG_CODE_DEL_RESP)
+
+    def listBuckets(self, store, data):
+        self.send(pbc.MSG_CODE_LIST_BUCKETS_RESP,
+                  pbc.RpbListBucketsResp(buckets=store.buckets.keys()))
+
+    def listKeys(self, store, data):
+        req = self.parse(pbc.RpbListKeysReq, data)
+        keys = store.keys(req.bucket)
+        for i in range(0, len(keys), CHUNK_SIZE):
+            self.send(pbc.MSG_CODE_LIST_KEYS_RESP,
+                      pbc.RpbListKeysResp(keys=keys[i:i + CHUNK_SIZE]))
+        self.send(pbc.MSG_CODE_LIST_KEYS_RESP, pbc.RpbListKeysResp(done=True))
+
+    def getBucket(self, store, data):
+        req = self.parse(pbc.RpbGetBucketReq, data)
+        resp = pbc.RpbGetBucketResp()
+        props = store.props.get(req.bucket, {})
+        resp.props.n_val = props.get('n_val', 3)
+        resp.props.allow_mult = props.get('allow_mult', False)
+        self.send(pbc.MSG_CODE_GET_BUCKET_RESP, resp)
+
+    def setBucket(self, store, data):
+        req = self.parse(pbc.RpbSetBucketReq, data)
+        props = store.props.setdefault(req.bucket, {})
+        for field, value in req.props.ListFields():
+            props[field.name] = value
+        self.send(pbc.MSG_CODE_SET_BUCKET_RESP)
+
+    def index(self, store, data):
+        req = self.parse(pbc.RpbIndexReq, data)
+        if req.qtype == pbc.RpbIndexReq.eq:
+            keys = store.index(req.bucket, req.index, req.key)
+        else:
+            keys = store.index(req.bucket, req.index, req.range_min,
+                               req.range_max)
+        self.send(pbc.MSG_CODE_INDEX_RESP, pbc.RpbIndexResp(keys=keys))
+
+    def mapred(self, store, data):
+        req = self.parse(pbc.RpbMapRedReq, data)
+        job = json.loads(req.request)
+        results = store.mapred(job)
+        phase = max(len(job.get('query', [])) - 1, 0)
+        for i in range(0, len(results), CHUNK_SIZE):
+            self.send(pbc.MSG_CODE_MAPRED_RESP, pbc.RpbMapRedResp(
+                phase=phase, response=json.dumps(results[i:i + CHUNK_SIZE])))
+        self.send(pbc.MSG_CODE_MAPRED_RESP, pbc.RpbMapRedResp(done=True))
+
+    handlers = {
+        pbc.MSG_CODE_PING_REQ: ping,
+        pbc.MSG_CODE_SET_CLIENT_ID_REQ: setClientId,
+        pbc.MSG_CODE_GET_SERVER_INFO_REQ: getServerInfo,
+        pbc.MSG_CODE_GET_REQ: get,
+        pbc.MSG_CODE_PUT_REQ: put,
+        pbc.MSG_CODE_DEL_REQ: delete,
+        pbc.MSG_CODE_LIST_BUCKETS_REQ: listBuckets,
+        pbc.MSG_CODE_LIST_KEYS_REQ: listKeys,
+        pbc.MSG_CODE_GET_BUCKET_REQ: getBucket,
+        pbc.MSG_CODE_SET_BUCKET_REQ: setBucket,
+        pbc.MSG_CODE_INDEX_REQ: index,
+        pbc.MSG_CODE_MAPRED_REQ: mapred,
+    }
+
+
+class FakeRiakPBCFactory(protocol.ServerFactory):
+    protocol = FakeRiakPBC
+    noisy = False
+
+    def __init__(self, store):
+        self.store = store
+
+
+class FakeRiakHTTP(resource.Resource):
+    isLeaf = True
+
+    def __init__(self, store, prefix='riak', mapred_prefix='mapred'):
+        resource.Resource.__init__(self)
+        self.store = store
+        self.prefix = prefix
+        self.mapred_prefix = mapred_prefix
+
+    def render(self, request):
+        segments = [urllib.unquote_plus(s)
+                    for s in request.path.strip('/').split('/')]
+        if segments == ['ping']:
+            return 'OK'
+        elif segments == ['stats']:
+            request.setHeader('content-type', 'application/json')
+            return json.dumps({'riak_kv_version': SERVER_VERSION})
+        elif segments[0] == self.prefix and len(segments) == 3:
+            return self.renderObject(request, segments[1], segments[2])
+        elif segments[0] == self.prefix and len(segments) == 2:
+            return self.renderBucket(request, segments[1])
+        elif segments[0] == self.prefix:
+            return self.json(request, {'buckets': self.store.buckets.keys()})
+        elif segments[0] == 'buckets' and segments[2:3] == ['index']:
+            keys = self.store.index(segments[1], segments[3], segments[4],
+                                    (segments[5:] or [None])[0])
+            return self.json(request, {'keys': keys})
+        elif segments == [self.mapred_prefix]:
+            return self.renderMapReduce(request)
+        request.setResponseCode(404)
+        return 'not found\n'
+
+    def json(self, request, data):
+        request.setHeader('content-type', 'application/json')
+        return json.dumps(data)
+
+    def renderObject(self, request, bucket, key):
+        store = self.store
+        if request.method in ('PUT', 'POST'):
+            return self.storeObject(request, bucket, key)
+        elif request.method == 'DELETE':
+            store.delete(bucket, key)
+            request.setResponseCode(204)
+            return ''
+
+        obj = store.get(bucket, key)
+        if obj is None:
+            request.setResponseCode(404)
+            return 'not found\n'
+        if request.getHeader('if-none-match') == obj['vtag']:
+            request.setResponseCode(304)
+            return ''
+        self.objectHeaders(request, obj)
+        return obj['value']
+
+    def objectHeaders(self, request, obj):
+        request.setHeader('content-type', obj['content_type'])
+        request.setHeader('x-riak-vclock', obj['vclock'])
+        request.setHeader('etag', obj['vtag'])
+        request.setHeader('last-modified', 'Thu, 01 Jan 1970 00:00:01 GMT')
+        for key, value in obj['usermeta']:
+            request.setHeader('x-riak-meta-' + key, value)
+        indexes = {}
+        for key, value in obj['indexes']:
+            indexes.setdefault(key, []).append(value)
+        for key, values in indexes.items():
+            request.setHeader('x-riak-index-' + key, ', '.join(values))
+
+    def storeObject(self, request, bucket, key):
+        usermeta, indexes = [], []
+        for name, values in request.requestHeaders.getAllRawHeaders():
+            name = name.lower()
+            if name.startswith('x-riak-meta-'):
+                usermeta.append((name[len('x-riak-meta-'):], values[0]))
+            elif name.startswith('x-riak-index-'):
+                field = name[len('x-riak-index-'):]
+                indexes.extend((field, value.strip())
+                               for value in values[0].split(','))
+
+        new = key is None
+        key, obj = self.store.put(bucket, key, {
+            'value': request.content.read(),
+            'content_type': request.getHeader('content-type'),
+            'usermeta': usermeta,
+            'indexes': indexes,
+        })
+        if new:
+            request.setHeader('location', '/%s/%s/%s' % (
+                self.prefix, urllib.quote_plus(bucket),
+                urllib.quote_plus(key)))
+
+        if request.args.get('returnbody') == ['true']:
+            request.setResponseCode(new and 201 or 200)
+            self.objectHeaders(request, obj)
+            return obj['value']
+        request.setResponseCode(new and 201 or 204)
+        return ''
+
+    def renderBucket(self, request, bucket):
+        store = self.store
+        if request.method == 'POST':
+            return self.storeObject(request, bucket, None)
+        elif request.method == 'PUT':
+            props = json.loads(request.content.read())['props']
+            store.props.setdefault(bucket, {}).update(props)
+            request.setResponseCode(204)
+            return ''
+
+        keys = request.args.get('keys', ['false'])[0]
+        if keys == 'stream':
+            request.setHeader('content-type', 'application/json')
+            allKeys = store.keys(bucket)
+            for i in range(0, len(allKeys), CHUNK_SIZE):
+                request.write(json.dumps(
+                    {'keys': allKeys[i:i + CHUNK_SIZE]}))
+            request.write(json.dumps({'keys': []}))
+            request.finish()
+            return server.NOT_DONE_YET
+
+        props = {'n_val': 3, 'allow_mult': False}
+        props.update(store.props.get(bucket, {}))
+        data = {'props': props}
+        if keys == 'true':
+            data['keys'] = store.keys(bucket)
+        return self.json(request, data)
+
+    def renderMapReduce(self, request):
+        job = json.loads(request.content.read())
+        results = self.store.mapred(job)
+        if request.args.get('chunked') != ['true']:
+            return self.json(request, results)
+
+        phase = max(len(job.get('query', [])) - 1, 0)
+        request.setHeader('content-type',
+                          'multipart/mixed; boundary=fakeriak')
+        for i in range(0, len(results), CHUNK_SIZE):
+            request.write(
+                '\r\n--fakeriak\r\nContent-Type: application/json\r\n\r\n' +
+                json.dumps({'phase': phase,
+                            'data': results[i:i + CHUNK_SIZE]}))
+        request.write('\r\n--fakeriak--\r\n')
+        request.finish()
+        return server.NOT_DONE_YET
+
+
+def listen(pbcPort=0, httpPort=0, interface='127.0.0.1', store=None):
+    """
+    Start a fake Riak node, by default on free ports. Returns the store
+    and the listening PBC and HTTP ports.
+    """
+    store = store or Store()
+    pbcListener = reactor.listenTCP(pbcPort, FakeRiakPBCFactory(store),
+                                    interface=interface)
+    site = server.Site(FakeRiakHTTP(store))
+    site.noisy = False
+    httpListener = reactor.listenTCP(httpPort, site, interface=interface)
+    return store, pbcListener, httpListener
+
+
+if __name__ == '__main__':
+    import sys
+    from twisted.python import log
+    log.startLogging(sys.stdout)
+    listen(8087, 8098)
+    reactor.run()
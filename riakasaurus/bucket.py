@@ -17,11 +17,19 @@ KIND, either express or implied.  See the License for the
 specific language governing permissions and limitations
 under the License.
 """
+from zope.interface import implements
+
 from twisted.internet import defer
+from twisted.python import failure, log
+from twisted.web.client import FileBodyProducer
+from twisted.web.iweb import IBodyProducer
 
 from riakasaurus.riak_object import RiakObject
+from riakasaurus.cache import RiakObjectCache
+from riakasaurus.index_page import IndexPage
 
 import mimetypes
+import os
 
 
 class RiakBucket(object):
@@ -33,6 +41,13 @@ class RiakBucket(object):
 
     SEARCH_PRECOMMIT_HOOK = {"mod": "riak_search_kv_hook", "fun": "precommit"}
 
+    # requests multiget() keeps in flight at the same time
+    MULTIGET_CONCURRENCY = 20
+    # deletes purge_keys() keeps in flight at the same time
+    PURGE_CONCURRENCY = 20
+    # results per page of index_pages()
+    INDEX_PAGE_SIZE = 1000
+
     def __init__(self, client, name):
         """
         Returns a new ``RiakBucket`` instance.
@@ -216,6 +231,77 @@ class RiakBucket(object):
         self._pw = pw
         return self
 
+    def enable_cache(self, size=None, ttl=None, max_age=0):
+        """
+        Cache the objects fetched with get() and get_binary() in this
+        bucket. A cached object is revalidated with the server on every
+        fetch, which skips transferring and decoding it if it did not
+        change. Objects stored or deleted through this client are
+        invalidated. The cache is shared by all RiakBucket instances of
+        the client with this name.
+
+        :param size: Maximum number of cached objects (defaults to
+         RiakObjectCache.MAX_SIZE)
+        :type size: integer
+        :param ttl: Seconds after which an object which has not been
+         revalidated is dropped (defaults to RiakObjectCache.TTL)
+        :type ttl: integer
+        :param max_age: Seconds during which a cached object is returned
+         without asking the server at all
+        :type max_age: integer
+        :rtype: :class:`RiakObjectCache <riakasaurus.cache.RiakObjectCache>`
+        """
+        cache = RiakObjectCache(size, ttl, max_age)
+        self._client._caches[self._name] = cache
+        return cache
+
+    def disable_cache(self):
+        """
+        Stop caching objects of this bucket.
+        """
+        self._client._caches.pop(self._name, None)
+
+    def get_cache(self):
+        """
+        The object cache of this bucket, None unless enable_cache() was
+        called.
+        """
+        return self._client._caches.get(self._name)
+
+    def set_resolver(self, resolver, write_back=False):
+        """
+        Resolve the siblings of objects in this bucket automatically,
+        instead of with the client's resolver. See
+        :func:`RiakClient.set_resolver
+        <riakasaurus.client.RiakClient.set_resolver>`. Like the object
+        cache, it applies to all RiakBucket instances of the client with
+        this name.
+
+        :param resolver: The resolver, None to use the client's
+        :type resolver: function
+        :param write_back: Store resolved objects
+        :type write_back: bool
+        :rtype: self
+        """
+        if resolver is None:
+            self._client._resolvers.pop(self._name, None)
+        else:
+            self._client._resolvers[self._name] = (resolver, write_back)
+        return self
+
+    def get_resolver(self):
+        """
+        The resolver of this bucket, or else of the client
+        """
+        return self._resolution()[0]
+
+    def _resolution(self):
+        try:
+            return self._client._resolvers[self._name]
+        except KeyError:
+            return (self._client._resolver,
+                    self._client._write_back_resolved)
+
     def get_encoder(self, content_type):
         """
         Get the encoding function for the provided content type for this
@@ -298,13 +384,20 @@ class RiakBucket(object):
 
         :param key: Name of the key.
         :type key: string
-        :param data: The data to store.
+        :param data: The data to store. A file-like object or an
+         IBodyProducer is streamed to Riak over HTTP when the object is
+         stored. A seekable file is wrapped in a FileObjectBody, which
+         sends it from its current position on every store and leaves it
+         open; a file that can't seek can only be stored once.
         :type data: object
         :param content_type: The content type of the object.
         :type content_type: string
         :rtype: :class:`RiakObject <riak.riak_object.RiakObject>`
         """
         obj = RiakObject(self._client, self, key)
+        if (hasattr(data, 'read') and not IBodyProducer.providedBy(data) and
+                _seekable(data)):
+            data = FileObjectBody(data)
         obj.set_data(data)
         obj.set_content_type(content_type)
         obj._encode_data = False
@@ -364,6 +457,67 @@ class RiakBucket(object):
         pr = self.get_pr(pr)
         return obj.reload(r=r, pr=pr)
 
+    def multiget(self, keys, r=None, pr=None, concurrency=None,
+                 binary=False, callback=None):
+        """
+        Retrieve several objects at once, with at most ``concurrency``
+        requests in flight. A failed fetch does not abort the others.
+
+        :param keys: Names of the keys.
+        :type keys: list
+        :param r: R-Value of the requests (defaults to bucket's R)
+        :type r: integer
+        :param pr: PR-Value of the requests (defaults to bucket's PR)
+        :type pr: integer
+        :param concurrency: Maximum number of concurrent requests
+         (defaults to MULTIGET_CONCURRENCY)
+        :type concurrency: integer
+        :param binary: Fetch the objects like get_binary() instead of get()
+        :type binary: boolean
+        :param callback: Called with (key, result) as soon as a key has
+         been fetched, to process results as they stream in
+        :type callback: function
+        :returns: dict of key to :class:`RiakObject
+         <riak.riak_object.RiakObject>`, missing keys map to objects for
+         which exists() is False and failed keys to the
+         :class:`Failure <twisted.python.failure.Failure>` - deferred
+        """
+        get = binary and self.get_binary or self.get
+        results = {}
+
+        def fetched(key, result):
+            results[key] = result
+            if callback is not None:
+                callback(key, result)
+
+        requests = _BulkRequests(lambda key: get(key, r=r, pr=pr), fetched,
+                                 concurrency or self.MULTIGET_CONCURRENCY)
+        requests.add(set(keys))
+        return requests.wait().addCallback(lambda _: results)
+
+    def stream_binary(self, key, consumer, r=None, pr=None):
+        """
+        Retrieve a binary object from Riak, writing its value to consumer
+        as it arrives instead of holding it in memory.
+
+        :param key: Name of the key.
+        :type key: string
+        :param consumer: Where the value is written to, it may pause and
+         resume the transfer.
+        :type consumer: IConsumer
+        :param r: R-Value of the request (defaults to bucket's R)
+        :type r: integer
+        :param pr: PR-Value of the request (defaults to bucket's PR)
+        :type pr: integer
+        :rtype: :class:`RiakObject <riak.riak_object.RiakObject>` holding
+         the metadata only
+        """
+        obj = RiakObject(self._client, self, key)
+        obj._encode_data = False
+        r = self.get_r(r)
+        pr = self.get_pr(pr)
+        return obj.stream(consumer, r=r, pr=pr)
+
     def set_n_val(self, nval):
         """
         Set the N-value for this bucket, which is the number of replicas
@@ -522,12 +676,28 @@ class RiakBucket(object):
         """
         return self._client.transport.get_keys(self)
 
+    def stream_keys(self, callback):
+        """
+        List all keys within the bucket without holding them in memory:
+        callback is called with every chunk of keys (a list) as it
+        arrives from Riak. If callback returns a deferred, no further
+        chunks are read until it fires.
+
+        :returns: None once all keys have been delivered - deferred
+
+        .. warning::
+
+           Like get_keys(), this is a very expensive operation.
+        """
+        return self._client.transport.stream_keys(self, callback)
+
     def new_binary_from_file(self, key, filename):
         """
         Create a new Riak object in the bucket, using the content of the
-        specified file.
+        specified file. The file is read when the object is stored, store
+        it with return_body=False to keep its content out of memory.
         """
-        binary_data = open(filename, "rb").read()
+        binary_data = FileBody(filename)
         mimetype, encoding = mimetypes.guess_type(filename)
         if not mimetype:
             mimetype = 'application/octet-stream'
@@ -599,28 +769,300 @@ class RiakBucket(object):
         return self._client.transport.get_index(
             self._name, index, startkey, endkey)
 
+    @defer.inlineCallbacks
+    def index_pages(self, index, startkey, endkey=None, max_results=None,
+                    return_terms=False, continuation=None):
+        """
+        Queries a secondary index over objects in this bucket a page at a
+        time, so large result sets need not be held at once. Requires
+        Riak 1.4.
+
+        :param max_results: Results per page (defaults to
+         INDEX_PAGE_SIZE)
+        :type max_results: integer
+        :param return_terms: Return (term, key) pairs instead of keys.
+         Riak only returns terms for range queries.
+        :type return_terms: boolean
+        :param continuation: Where to start, the continuation of the
+         previous page
+        :type continuation: string
+        :returns: the first page, call its next_page() for the next one
+         - deferred :class:`IndexPage <riakasaurus.index_page.IndexPage>`
+        """
+        max_results = max_results or self.INDEX_PAGE_SIZE
+        results, next_continuation = yield \
+            self._client.transport.index_page(
+                self._name, index, startkey, endkey,
+                return_terms=return_terms, max_results=max_results,
+                continuation=continuation)
+        defer.returnValue(IndexPage(self, index, startkey, endkey, results,
+                                    next_continuation, max_results,
+                                    return_terms))
+
+    def stream_index(self, callback, index, startkey, endkey=None,
+                     return_terms=False, max_results=None,
+                     continuation=None):
+        """
+        Queries a secondary index over objects in this bucket without
+        holding the results in memory: callback is called with every
+        chunk of keys (a list), or (term, key) pairs if return_terms is
+        set, as it arrives from Riak. If callback returns a deferred, no
+        further chunks are read until it fires. Requires Riak 1.4.
+
+        :param max_results: Stop after this many results
+        :type max_results: integer
+        :param continuation: Where to start, as returned by a previous
+         query
+        :type continuation: string
+        :returns: the continuation if max_results stopped the query, None
+         otherwise - deferred
+        """
+        return self._client.transport.stream_index(
+            self._name, callback, index, startkey, endkey,
+            return_terms=return_terms, max_results=max_results,
+            continuation=continuation)
+
+    @defer.inlineCallbacks
+    def stream_index_objects(self, callback, index, startkey, endkey=None,
+                             r=None, pr=None, concurrency=None, binary=False,
+                             max_results=None, continuation=None):
+        """
+        Queries a secondary index over objects in this bucket and fetches
+        the matching objects, starting with the first keys while the
+        query is still streaming. At most ``concurrency`` fetches are in
+        flight, the query is not read further ahead of them. A failed
+        fetch does not abort the others.
+
+        Riak before 1.4 can't stream index queries, there the keys are
+        fetched once the query has returned them all and max_results and
+        continuation are ignored.
+
+        :param callback: Called with (key, result) as soon as a key has
+         been fetched, result is like in multiget(). If it returns a
+         deferred, the fetch counts as in flight until it fires.
+        :type callback: function
+        :param r: R-Value of the requests (defaults to bucket's R)
+        :type r: integer
+        :param pr: PR-Value of the requests (defaults to bucket's PR)
+        :type pr: integer
+        :param concurrency: Maximum number of concurrent requests
+         (defaults to MULTIGET_CONCURRENCY)
+        :type concurrency: integer
+        :param binary: Fetch the objects like get_binary() instead of get()
+        :type binary: boolean
+        :param max_results: Stop after this many keys
+        :type max_results: integer
+        :param continuation: Where to start, as returned by a previous
+         query
+        :type continuation: string
+        :returns: the continuation if max_results stopped the query, None
+         otherwise - deferred
+        """
+        get = binary and self.get_binary or self.get
+
+        def fetch(key):
+            d = get(key, r=r, pr=pr)
+            return d.addBoth(lambda result: callback(key, result))
+
+        def fetched(key, result):
+            if isinstance(result, failure.Failure):
+                log.err(result, 'fetching %s/%s' % (self._name, key))
+
+        requests = _BulkRequests(fetch, fetched,
+                                 concurrency or self.MULTIGET_CONCURRENCY)
+        paginated = yield self._client.get_transport().paginated_indexes()
+        if paginated:
+            continuation = yield self.stream_index(
+                requests.add, index, startkey, endkey,
+                max_results=max_results, continuation=continuation)
+        else:
+            keys = yield self.get_index(index, startkey, endkey)
+            yield requests.add(keys)
+            continuation = None
+        yield requests.wait()
+        defer.returnValue(continuation)
+
     def list_keys(self):
         """ Same as get_keys - for txRiak compat """
         return self.get_keys()
 
     @defer.inlineCallbacks
-    def purge_keys(self):
+    def purge_keys(self, concurrency=None, fetch=False, callback=None):
         """
         Purge all keys from the bucket. Specific to Riakasaurus
 
-        :returns: None
-
-        This is a convenience function that lists all of the keys
-        in the bucket and then deletes them.
+        Keys are deleted as they are listed, with at most ``concurrency``
+        deletes in flight. A failed delete does not stop the others, the
+        first failure is raised once all keys have been tried.
+
+        :param concurrency: Maximum number of concurrent deletes
+         (defaults to PURGE_CONCURRENCY)
+        :type concurrency: integer
+        :param fetch: Fetch every object and delete it with its vclock,
+         rather than deleting it blindly. Blind deletes cost one request
+         instead of two, but with allow_mult they can leave a tombstone
+         sibling next to the value.
+        :type fetch: boolean
+        :param callback: Called with (key, result) as soon as a key has
+         been deleted, to report progress
+        :type callback: function
+        :returns: the number of deleted keys - deferred
 
         NB: This is a VERY resource-intensive operation, and is
             IRREVERSIBLE. Be careful.
         """
+        failures = []
+        deleted = [0]
+
+        def purge(key):
+            if fetch:
+                d = self.get_binary(key)
+                return d.addCallback(lambda obj: obj.delete())
+            return RiakObject(self._client, self, key).delete()
+
+        def purged(key, result):
+            if isinstance(result, failure.Failure):
+                failures.append(result)
+            else:
+                deleted[0] += 1
+            if callback is not None:
+                try:
+                    callback(key, result)
+                except Exception:
+                    failures.append(failure.Failure())
+
+        requests = _BulkRequests(purge, purged,
+                                 concurrency or self.PURGE_CONCURRENCY)
+        yield self.stream_keys(requests.add)
+        yield requests.wait()
+        if failures:
+            failures[0].raiseException()
+        defer.returnValue(deleted[0])
+
+
+class _BulkRequests(object):
+    """
+    Runs request(key) for every key added, with at most concurrency
+    requests in flight, and calls handler(key, result) as each of them
+    finishes, result being a Failure if the request failed.
+    """
 
-        # Get the current key list
-        keys = yield self.get_keys()
+    def __init__(self, request, handler, concurrency):
+        self._request = request
+        self._handler = handler
+        self._sem = defer.DeferredSemaphore(concurrency)
+        self._outstanding = set()
+        self._failures = []
 
-        # Major key-killing action
+    def add(self, keys):
+        """
+        Request keys. The semaphore is FIFO, so the deferred returned
+        fires once all the keys added so far are being requested: a
+        listing waiting for it does not run ahead of the requests.
+        """
         for key in keys:
-            obj = yield self.get_binary(key)
-            yield obj.delete()
+            d = self._sem.run(self._request, key)
+            self._outstanding.add(d)
+            d.addBoth(self._finished, key, d)
+        return self._sem.run(lambda: None)
+
+    def _finished(self, result, key, d):
+        self._outstanding.discard(d)
+        try:
+            self._handler(key, result)
+        except Exception:
+            self._failures.append(failure.Failure())
+
+    @defer.inlineCallbacks
+    def wait(self):
+        """
+        Fires once all the requests have finished, fails with the first
+        exception a handler raised.
+        """
+        yield defer.DeferredList(list(self._outstanding))
+        if self._failures:
+            self._failures[0].raiseException()
+
+
+class FileBody(object):
+    """
+    The content of a file as the data of an object, see
+    RiakBucket.new_binary_from_file(). The file is opened afresh every
+    time the object is stored and closed once it has been sent, so the
+    object can be stored more than once.
+    """
+    implements(IBodyProducer)
+
+    def __init__(self, filename):
+        self.filename = filename
+        self._producer = None
+
+    @property
+    def length(self):
+        return os.path.getsize(self.filename)
+
+    def startProducing(self, consumer):
+        self._producer = FileBodyProducer(self._open())
+        return self._producer.startProducing(consumer)
+
+    def _open(self):
+        return open(self.filename, 'rb')
+
+    def pauseProducing(self):
+        self._producer.pauseProducing()
+
+    def resumeProducing(self):
+        self._producer.resumeProducing()
+
+    def stopProducing(self):
+        if self._producer is not None:
+            self._producer.stopProducing()
+
+
+class FileObjectBody(FileBody):
+    """
+    The rest of a seekable file object as the data of an object, see
+    RiakBucket.new_binary(). The file is rewound to where it was when the
+    object was created every time the object is stored, and left open
+    for the caller to close.
+    """
+
+    def __init__(self, fileobj):
+        self.fileobj = fileobj
+        self._start = fileobj.tell()
+        self._producer = None
+
+    @property
+    def length(self):
+        position = self.fileobj.tell()
+        self.fileobj.seek(0, os.SEEK_END)
+        end = self.fileobj.tell()
+        self.fileobj.seek(position)
+        return end - self._start
+
+    def _open(self):
+        self.fileobj.seek(self._start)
+        return _Unclosed(self.fileobj)
+
+
+class _Unclosed(object):
+    """
+    Hides close() of a file from the FileBodyProducer reading it.
+    """
+
+    def __init__(self, fileobj):
+        self._fileobj = fileobj
+
+    def __getattr__(self, name):
+        return getattr(self._fileobj, name)
+
+    def close(self):
+        pass
+
+
+def _seekable(fileobj):
+    try:
+        fileobj.tell()
+    except (AttributeError, IOError):
+        return False
+    return True
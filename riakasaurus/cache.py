@@ -0,0 +1,228 @@
+"""
+.. module:: cache.py
+
+Client side read-through cache of Riak objects and coalescing of
+concurrent identical fetches.
+
+"""
+
+import time
+from collections import deque
+
+from twisted.internet import defer
+
+from riakasaurus.metadata import *
+
+# returned by a transport's get() when the copy passed as if_modified is
+# still current
+UNCHANGED = object()
+
+
+class RiakObjectCache(object):
+    """
+    A bounded LRU cache of fetched objects for a bucket, see
+    :func:`RiakBucket.enable_cache <riakasaurus.bucket.RiakBucket.enable_cache>`.
+
+    Cached objects are revalidated with the server (by vclock over PBC,
+    by vtag over HTTP) so an unchanged object costs a round trip but no
+    body transfer. Objects younger than max_age seconds are returned
+    without asking the server at all. Objects not validated for ttl
+    seconds are dropped.
+    """
+    MAX_SIZE = 1000
+    TTL = 60    # in seconds
+
+    def __init__(self, size=None, ttl=None, max_age=0):
+        self.size = size or self.MAX_SIZE
+        self.ttl = ttl or self.TTL
+        self.max_age = max_age
+        # key: [validated, result, last use]
+        self._entries = {}
+        # (use, key) from least to most recently used. A key has a pair
+        # for each of its uses, only the one matching its entry counts.
+        self._uses = deque()
+        self._use = 0
+        # bumped by every invalidation, fetches which started before one
+        # must not cache what they got
+        self._generation = 0
+        self._stats = {
+            'hits': 0,
+            'misses': 0,
+            'unchanged': 0,
+            'evictions': 0,
+        }
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _lookup(self, key):
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        if entry[0] + self.ttl <= time.time():
+            del self._entries[key]
+            self._stats['evictions'] += 1
+            return None
+        self._used(key, entry)
+        return entry
+
+    def _used(self, key, entry):
+        self._use += 1
+        entry[2] = self._use
+        self._uses.append((self._use, key))
+        if len(self._uses) > 2 * self.size:
+            # drop the pairs of earlier uses
+            self._uses = deque(sorted((e[2], k) for k, e
+                                      in self._entries.iteritems()))
+
+    def _store(self, key, result, generation):
+        if generation != self._generation:
+            return
+        # siblings, tombstones and missing objects are not cached
+        if not isinstance(result, tuple) or len(result[1]) != 1:
+            return
+        metadata = result[1][0][0]
+        if metadata.get(MD_DELETED) or not metadata.get(MD_VTAG):
+            return
+
+        entry = self._entries[key] = [time.time(), _copy_result(result), 0]
+        self._used(key, entry)
+        while len(self._entries) > self.size:
+            use, oldest = self._uses.popleft()
+            entry = self._entries.get(oldest)
+            if entry is not None and entry[2] == use:
+                del self._entries[oldest]
+                self._stats['evictions'] += 1
+
+    @defer.inlineCallbacks
+    def get(self, robj, r=None, pr=None):
+        """
+        Fetch robj, answering from the cache where possible. Returns a
+        transport get() result the caller may modify.
+        """
+        key = robj.get_key()
+        generation = self._generation
+        entry = self._lookup(key)
+
+        if entry is None:
+            self._stats['misses'] += 1
+            result = yield robj._fetch(r=r, pr=pr)
+            self._store(key, result, generation)
+            defer.returnValue(result)
+
+        cached = entry[1]
+        if entry[0] + self.max_age > time.time():
+            self._stats['hits'] += 1
+            defer.returnValue(_copy_result(cached))
+
+        vclock, [(metadata, data)] = cached
+        result = yield robj._fetch(r=r, pr=pr,
+                                   if_modified=(vclock, metadata[MD_VTAG]))
+        if result is UNCHANGED:
+            self._stats['unchanged'] += 1
+            if generation == self._generation:
+                entry[0] = time.time()
+            defer.returnValue(_copy_result(cached))
+
+        self._stats['misses'] += 1
+        self._entries.pop(key, None)
+        self._store(key, result, generation)
+        defer.returnValue(result)
+
+    def invalidate(self, key):
+        """
+        Forget key, e.g. because it was stored or deleted.
+        """
+        self._generation += 1
+        self._entries.pop(key, None)
+
+    def clear(self):
+        self._generation += 1
+        self._entries.clear()
+        self._uses.clear()
+
+    def stats(self):
+        """
+        Return the cache counters and its size
+        """
+        stats = dict(self._stats)
+        stats['size'] = len(self._entries)
+        return stats
+
+
+class InflightGets(object):
+    """
+    Lets concurrent fetches of the same object with the same parameters
+    share one request, see the coalesce_gets option of
+    :class:`RiakClient <riakasaurus.client.RiakClient>`. Every caller gets
+    its own copy of the result.
+    """
+
+    def __init__(self):
+        self._inflight = {}
+        self._stats = {
+            'requests': 0,
+            'coalesced': 0,
+        }
+
+    def get(self, transport, robj, **kwargs):
+        """
+        Fetch robj through transport, kwargs are passed to its get().
+        """
+        key = (robj.get_bucket().get_name(), robj.get_key(),
+               tuple(sorted(kwargs.items())))
+        d = defer.Deferred()
+        waiting = self._inflight.get(key)
+        if waiting is not None:
+            self._stats['coalesced'] += 1
+            waiting.append(d)
+            return d
+
+        self._stats['requests'] += 1
+        waiting = self._inflight[key] = [d]
+
+        def done(result):
+            del self._inflight[key]
+            # copy before any caller gets to modify the result
+            if isinstance(result, tuple):
+                results = [_copy_result(result) for d in waiting[1:]]
+            elif isinstance(result, list):
+                results = [list(result) for d in waiting[1:]]
+            else:
+                results = [result] * (len(waiting) - 1)
+            for d, result in zip(waiting, [result] + results):
+                d.callback(result)
+
+        defer.maybeDeferred(transport.get, robj, **kwargs).addBoth(done)
+        return d
+
+    def stats(self):
+        """
+        Return the number of requests sent and of fetches which shared
+        one of them
+        """
+        stats = dict(self._stats)
+        stats['inflight'] = len(self._inflight)
+        return stats
+
+
+def _copy_result(result):
+    """
+    Copy the parts of a get() result RiakObject.populate() modifies.
+    """
+    vclock, contents = result
+    copied = []
+    for metadata, data in contents:
+        metadata = metadata.copy()
+        if isinstance(metadata, LazyMetadata):
+            # not built yet, every copy builds its own
+            copied.append((metadata, data))
+            continue
+        if MD_USERMETA in metadata:
+            metadata[MD_USERMETA] = dict(metadata[MD_USERMETA])
+        if MD_INDEX in metadata:
+            metadata[MD_INDEX] = list(metadata[MD_INDEX])
+        if MD_LINKS in metadata:
+            metadata[MD_LINKS] = list(metadata[MD_LINKS])
+        copied.append((metadata, data))
+    return vclock, copied
@@ -12,9 +12,12 @@ import json
 from twisted.internet import defer
 
 from riakasaurus import mapreduce, bucket
+from riakasaurus.cache import InflightGets
+from riakasaurus.resolver import WriteBack
 from riakasaurus.search import RiakSearch
 
 from riakasaurus import transport
+from riakasaurus.transport import nodes as riak_nodes
 
 
 class RiakClient(object):
@@ -22,18 +25,37 @@ class RiakClient(object):
     The RiakClient object holds information necessary to connect to
     Riak.
     """
+    # requests multiput() keeps in flight at the same time
+    MULTIPUT_CONCURRENCY = 20
+
     def __init__(self, host='127.0.0.1', port=8098,
                 prefix='riak', mapred_prefix='mapred',
                 client_id=None, r_value="default", w_value="default",
                 dw_value="default", transport=transport.HTTPTransport,
-                request_timeout=None):
+                request_timeout=None, nodes=None,
+                node_selection=riak_nodes.ROUND_ROBIN, server_version=None,
+                coalesce_gets=False, metrics=None):
         """
         Construct a new RiakClient object.
 
         If a client_id is not provided, generate a random one.
-        """
-        self._host = host
-        self._port = port
+
+        nodes is a list of ``(host, port)`` tuples or ``"host[:port]"``
+        strings of the cluster members to spread requests across, it
+        defaults to host:port. node_selection is either 'round_robin' or
+        'least_outstanding'. server_version (e.g. ``"1.4.0"``) spares
+        the transport from asking the server for its version. With
+        coalesce_gets, concurrent fetches of the same object with the
+        same parameters share a single request. metrics is an
+        :class:`IMetrics <riakasaurus.metrics.IMetrics>` provider, e.g. a
+        :class:`RiakMetrics <riakasaurus.metrics.RiakMetrics>`, every
+        request is reported to.
+        """
+        if nodes is None:
+            nodes = [(host, port)]
+        nodes = [self._parse_node(node, port) for node in nodes]
+        self._nodes = riak_nodes.RiakNodeSet(nodes, node_selection)
+        self._host, self._port = nodes[0]
         self._prefix = prefix
         self._mapred_prefix = mapred_prefix
         if client_id:
@@ -56,8 +78,31 @@ class RiakClient(object):
         self._solr = None
 
         self.request_timeout = request_timeout
+        self.metrics = metrics
+
+        # object caches by bucket name, see RiakBucket.enable_cache()
+        self._caches = {}
+        # sibling resolution, see set_resolver()
+        self._resolver = None
+        self._write_back_resolved = False
+        self._resolvers = {}
+        self._write_back = None
+        self._inflight_gets = coalesce_gets and InflightGets() or None
+
+        # created on demand by the first HTTP transport
+        self._http_pool = None
 
         self.transport = transport(self)
+        if server_version is not None:
+            self.transport.set_server_version(server_version)
+
+    @staticmethod
+    def _parse_node(node, port):
+        if isinstance(node, basestring):
+            if ':' in node:
+                node, port = node.rsplit(':', 1)
+            return node, int(port)
+        return tuple(node)
 
     def setRequestTimeout(self, timeout):
         self.request_timeout = timeout
@@ -65,6 +110,14 @@ class RiakClient(object):
     def get_transport(self):
         return self.transport
 
+    def get_nodes(self):
+        """
+        Get the health and load of the Riak nodes this client talks to.
+
+        :returns: list of dicts
+        """
+        return self._nodes.stats()
+
     def get_r(self):
         """
         Get the R-value setting for this RiakClient. (default 2)
@@ -220,6 +273,42 @@ class RiakClient(object):
         self._encoders[content_type] = encoder
         return self
 
+    def set_resolver(self, resolver, write_back=False):
+        """
+        Resolve siblings automatically whenever an object is loaded with
+        them, unless its bucket has a resolver of its own. resolver is
+        called with the list of sibling objects and returns the one to
+        keep (e.g. :func:`last_write_wins
+        <riakasaurus.resolver.last_write_wins>`, or a sibling given merged
+        data), or None to keep the siblings. With write_back, resolved
+        objects are stored back in the background, see
+        :class:`WriteBack <riakasaurus.resolver.WriteBack>`.
+
+        :param resolver: The resolver, None to stop resolving
+        :type resolver: function
+        :param write_back: Store resolved objects
+        :type write_back: bool
+        :rtype: self
+        """
+        self._resolver = resolver
+        self._write_back_resolved = write_back
+        return self
+
+    def get_resolver(self):
+        """
+        Get the resolver set by set_resolver()
+        """
+        return self._resolver
+
+    def get_write_back(self):
+        """
+        The :class:`WriteBack <riakasaurus.resolver.WriteBack>` storing
+        resolved objects, e.g. to flush() it before shutting down.
+        """
+        if self._write_back is None:
+            self._write_back = WriteBack()
+        return self._write_back
+
     def get_decoder(self, content_type):
         """
         Get the decoding function for the provided content type.
@@ -245,6 +334,50 @@ class RiakClient(object):
         """
         return bucket.RiakBucket(self, name)
 
+    def multiput(self, objects, w=None, dw=None, pw=None, concurrency=None,
+                 return_body=False, callback=None):
+        """
+        Store several objects at once, with at most ``concurrency``
+        requests in flight. A failed store does not abort the others.
+
+        :param objects: The objects to store.
+        :type objects: list of :class:`RiakObject
+         <riak.riak_object.RiakObject>`
+        :param w: W-value (defaults to each bucket's W)
+        :type w: integer
+        :param dw: DW-value (defaults to each bucket's DW)
+        :type dw: integer
+        :param pw: PW-value (defaults to each bucket's PW)
+        :type pw: integer
+        :param concurrency: Maximum number of concurrent requests
+         (defaults to MULTIPUT_CONCURRENCY)
+        :type concurrency: integer
+        :param return_body: if the stored objects should be retrieved,
+         off by default to save Riak sending every object back. Without it
+         the objects keep the vclock they had before the store, so storing
+         them again can create siblings when allow_mult is on.
+        :type return_body: bool
+        :param callback: Called with (object, result) as soon as an
+         object has been stored
+        :type callback: function
+        :returns: list of (success, object or failure) tuples in the order
+         of objects -- via deferred
+        """
+        sem = defer.DeferredSemaphore(
+            concurrency or self.MULTIPUT_CONCURRENCY)
+
+        def stored(result, obj):
+            if callback is not None:
+                callback(obj, result)
+            return result
+
+        ds = []
+        for obj in objects:
+            d = sem.run(obj.store, w=w, dw=dw, pw=pw,
+                        return_body=return_body)
+            ds.append(d.addBoth(stored, obj))
+        return defer.DeferredList(ds, consumeErrors=True)
+
     def ping(self):
         """
         Check if the Riak server for this RiakClient is alive.
@@ -10,6 +10,12 @@ class ConnectTimeout(Exception):
     """
 
 
+class PoolExhausted(Exception):
+    """
+        Raised when no connection could be acquired from a transport's pool
+    """
+
+
 class RiakPBCException(Exception):
     """Generic PBC exception"""
     pass
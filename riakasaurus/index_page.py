@@ -0,0 +1,50 @@
+"""
+.. module:: index_page.py
+
+A page of the results of a secondary index query, see
+:func:`RiakBucket.index_pages <riakasaurus.bucket.RiakBucket.index_pages>`.
+
+"""
+
+
+class IndexPage(object):
+    """
+    The keys, or (term, key) pairs if terms were requested, of one page
+    of a secondary index query. Iterating over the page yields them.
+    """
+
+    def __init__(self, bucket, index, startkey, endkey, results,
+                 continuation, max_results, return_terms):
+        self._bucket = bucket
+        self._index = index
+        self._startkey = startkey
+        self._endkey = endkey
+        self._max_results = max_results
+        self._return_terms = return_terms
+        self.results = results
+        self.continuation = continuation
+
+    def __iter__(self):
+        return iter(self.results)
+
+    def __len__(self):
+        return len(self.results)
+
+    def has_next_page(self):
+        """
+        Whether Riak may have more results, an empty page is possible
+        """
+        return self.continuation is not None
+
+    def next_page(self):
+        """
+        Fetch the page following this one.
+
+        :returns: IndexPage - deferred
+        """
+        if not self.has_next_page():
+            raise ValueError('this is the last page')
+        return self._bucket.index_pages(
+            self._index, self._startkey, self._endkey,
+            max_results=self._max_results, return_terms=self._return_terms,
+            continuation=self.continuation)
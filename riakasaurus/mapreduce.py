@@ -196,13 +196,10 @@ class RiakMapReduce(object):
         self._phases.append(mr)
         return self
 
-    @defer.inlineCallbacks
-    def run(self, timeout=None):
+    def _prepare(self):
         """
-        Run the map/reduce operation. Returns an array of results, or an
-        array of RiakLink objects if the last phase is a link phase.
-        @param integer timeout - Timeout in milliseconds.
-        @return array()
+        Turn the phases and inputs into a job for the transport.
+        @return tuple - (inputs, query, link_results_flag)
         """
         num_phases = len(self._phases)
 
@@ -240,22 +237,16 @@ class RiakMapReduce(object):
                     'key_filters':  self._key_filters
                 }
 
-        t = self._client.get_transport()
-        result = yield t.mapred(self._inputs, query, timeout)
-
-        # If the last phase is NOT a link phase, then return the result.
+        # If the last phase is a link phase, results are links
         link_results_flag = link_results_flag or isinstance(
             self._phases[-1], RiakLinkPhase)
 
-        if not link_results_flag:
-            defer.returnValue(result)
-
-        # If there are no results, then return an empty list.
-        if result == None:
-            defer.returnValue([])
+        return self._inputs, query, link_results_flag
 
-        # Otherwise, if the last phase IS a link phase, then convert the
-        # results to RiakLink objects.
+    def _to_links(self, result):
+        """
+        Convert link phase results to RiakLink objects.
+        """
         a = []
         for r in result:
             if (len(r) == 2):
@@ -264,8 +255,54 @@ class RiakMapReduce(object):
                 link = RiakLink(r[0], r[1], r[2])
             link._client = self._client
             a.append(link)
+        return a
 
-        defer.returnValue(a)
+    @defer.inlineCallbacks
+    def run(self, timeout=None):
+        """
+        Run the map/reduce operation. Returns an array of results, or an
+        array of RiakLink objects if the last phase is a link phase.
+        @param integer timeout - Timeout in milliseconds.
+        @return array()
+        """
+        inputs, query, link_results_flag = self._prepare()
+
+        t = self._client.get_transport()
+        result = yield t.mapred(inputs, query, timeout)
+
+        # If the last phase is NOT a link phase, then return the result.
+        if not link_results_flag:
+            defer.returnValue(result)
+
+        # If there are no results, then return an empty list.
+        if result == None:
+            defer.returnValue([])
+
+        # Otherwise, if the last phase IS a link phase, then convert the
+        # results to RiakLink objects.
+        defer.returnValue(self._to_links(result))
+
+    def stream(self, callback, timeout=None):
+        """
+        Run the map/reduce operation, handing results to callback as they
+        arrive instead of collecting them. callback is called with the
+        index of the phase and a list of results of that phase, which are
+        RiakLink objects for a final link phase. If callback returns a
+        deferred, no further results are read until it fires.
+        @param function callback - Called with (phase, results).
+        @param integer timeout - Timeout in milliseconds.
+        @return deferred - fires with None once all results are delivered
+        """
+        inputs, query, link_results_flag = self._prepare()
+        last_phase = len(query) - 1
+
+        def gotResults(phase, results):
+            if link_results_flag and phase == last_phase:
+                results = self._to_links(results)
+            return callback(phase, results)
+
+        t = self._client.get_transport()
+        return t.stream_mapred(inputs, query, gotResults, timeout)
 
     ##
     # Start Shortcuts to built-ins
@@ -414,6 +451,7 @@ class RiakLink(object):
     The RiakLink object represents a link from one Riak object to
     another.
     """
+    __slots__ = ('_bucket', '_key', '_tag', '_client')
 
     def __init__(self, bucket, key, tag=None):
         """
@@ -27,3 +27,63 @@ MD_LASTMOD_USECS = "lastmod-usecs"
 MD_USERMETA = "usermeta"
 MD_INDEX = "index"
 MD_DELETED = "deleted"
+
+# built on first access by LazyMetadata
+LAZY_KEYS = frozenset([MD_LINKS, MD_USERMETA, MD_INDEX])
+
+
+class LazyMetadata(dict):
+    """
+    Metadata whose links, user metadata and indexes are only built when
+    one of them, or the whole dict, is first accessed. loader is called
+    (once per copy) to return them as a dict, it must at least return
+    MD_USERMETA and MD_INDEX. Entries set before take precedence.
+    """
+
+    def __init__(self, loader, *args, **kwargs):
+        dict.__init__(self, *args, **kwargs)
+        self._loader = loader
+
+    def expand(self):
+        loader, self._loader = self._loader, None
+        if loader is not None:
+            for key, value in loader().iteritems():
+                if not dict.__contains__(self, key):
+                    dict.__setitem__(self, key, value)
+        return self
+
+    def expanded(self):
+        return self._loader is None
+
+    def copy(self):
+        if self._loader is None:
+            return dict(self)
+        return LazyMetadata(self._loader, self)
+
+    def __reduce__(self):
+        return dict, (dict(self.expand()),)
+
+
+def _expanding(name, keyed):
+    method = getattr(dict, name)
+    if keyed:
+        def wrapper(self, key, *args):
+            if self._loader is not None and key in LAZY_KEYS:
+                self.expand()
+            return method(self, key, *args)
+    else:
+        def wrapper(self, *args):
+            if self._loader is not None:
+                self.expand()
+            return method(self, *args)
+    wrapper.__name__ = name
+    return wrapper
+
+for _name in ('__getitem__', '__contains__', '__delitem__', 'get', 'has_key',
+              'pop', 'setdefault'):
+    setattr(LazyMetadata, _name, _expanding(_name, True))
+for _name in ('__iter__', '__len__', '__eq__', '__ne__', '__repr__', 'keys',
+              'values', 'items', 'iterkeys', 'itervalues', 'iteritems',
+              'popitem'):
+    setattr(LazyMetadata, _name, _expanding(_name, False))
+del _name
@@ -0,0 +1,158 @@
+"""
+.. module:: metrics.py
+
+Instrumentation of the requests sent to Riak. Pass an object providing
+IMetrics as the metrics argument of
+:class:`RiakClient <riakasaurus.client.RiakClient>` to have the transports
+report to it; RiakMetrics collects everything in memory.
+
+"""
+
+import bisect
+
+from zope.interface import Interface, implements
+from twisted.internet import error
+
+from riakasaurus import exceptions
+
+TIMEOUTS = (exceptions.RequestTimeout, exceptions.ConnectTimeout,
+            error.TimeoutError)
+
+
+class IMetrics(Interface):
+    def request(operation, bucket, seconds, reason=None):
+        """
+        a request has been answered after seconds, or failed with reason
+        (a Failure). operation is the name of the Riak request, e.g.
+        'get', 'put' or 'mapred'. bucket is None for requests which are
+        not about a single bucket. Over PBC the time is measured from
+        sending the request to the response, over HTTP it includes
+        connecting.
+        """
+
+    def bytes_sent(count):
+        """
+        count bytes of requests have been sent. Over HTTP only bodies
+        given as strings are counted.
+        """
+
+    def bytes_received(count):
+        """
+        count bytes of responses have been received. Over HTTP only
+        bodies which are not streamed are counted.
+        """
+
+    def acquire_wait(seconds, timed_out=False):
+        """
+        a request waited seconds for a connection of the exhausted pool,
+        timed_out if it gave up
+        """
+
+
+class Histogram(object):
+    """
+    Counts values into fixed buckets (upper bounds in BOUNDS), so
+    recording is cheap and percentiles are estimates.
+    """
+    # in seconds
+    BOUNDS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25,
+              0.5, 1, 2.5, 5, 10)
+
+    def __init__(self):
+        self.counts = [0] * (len(self.BOUNDS) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def add(self, value):
+        self.counts[bisect.bisect_left(self.BOUNDS, value)] += 1
+        self.count += 1
+        self.sum += value
+        if value > self.max:
+            self.max = value
+
+    def percentile(self, p):
+        """
+        upper bound of the bucket holding the p-th percentile (0 - 100)
+        """
+        if not self.count:
+            return 0.0
+        rank = self.count * p / 100.0
+        seen = 0
+        for bound, count in zip(self.BOUNDS, self.counts):
+            seen += count
+            if seen >= rank:
+                return min(bound, self.max)
+        return self.max
+
+    def snapshot(self):
+        return {
+            'count': self.count,
+            'sum': self.sum,
+            'mean': self.count and self.sum / self.count or 0.0,
+            'max': self.max,
+            'p50': self.percentile(50),
+            'p90': self.percentile(90),
+            'p99': self.percentile(99),
+            'buckets': dict(zip(self.BOUNDS + (None,), self.counts)),
+        }
+
+
+class RiakMetrics(object):
+    """
+    Collects latency histograms and error counts per operation and bucket,
+    byte counters and pool wait times in memory. snapshot() returns
+    everything as plain dicts, e.g. to be exported by a stats endpoint.
+    """
+    implements(IMetrics)
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self._requests = {}
+        self._bytes_sent = 0
+        self._bytes_received = 0
+        self._acquire_wait = Histogram()
+        self._acquire_timeouts = 0
+
+    def request(self, operation, bucket, seconds, reason=None):
+        key = (operation, bucket)
+        entry = self._requests.get(key)
+        if entry is None:
+            entry = self._requests[key] = [Histogram(), 0, 0]
+        entry[0].add(seconds)
+        if reason is not None:
+            if reason.check(*TIMEOUTS):
+                entry[2] += 1
+            else:
+                entry[1] += 1
+
+    def bytes_sent(self, count):
+        self._bytes_sent += count
+
+    def bytes_received(self, count):
+        self._bytes_received += count
+
+    def acquire_wait(self, seconds, timed_out=False):
+        self._acquire_wait.add(seconds)
+        if timed_out:
+            self._acquire_timeouts += 1
+
+    def snapshot(self):
+        requests = {}
+        for (operation, bucket), (histogram, errors, timeouts) in \
+                self._requests.items():
+            stats = histogram.snapshot()
+            stats['errors'] = errors
+            stats['timeouts'] = timeouts
+            requests.setdefault(operation, {})[bucket] = stats
+
+        acquire_wait = self._acquire_wait.snapshot()
+        acquire_wait['timeouts'] = self._acquire_timeouts
+        return {
+            'requests': requests,
+            'bytes_sent': self._bytes_sent,
+            'bytes_received': self._bytes_received,
+            'acquire_wait': acquire_wait,
+        }
@@ -0,0 +1,138 @@
+"""
+.. module:: resolver.py
+
+Automatic resolution of siblings, see
+:func:`RiakClient.set_resolver <riakasaurus.client.RiakClient.set_resolver>`
+and :func:`RiakBucket.set_resolver
+<riakasaurus.bucket.RiakBucket.set_resolver>`. A resolver is called with
+the sibling RiakObjects of an object and returns the one to keep, which
+may be one of them given merged data, or None to keep the siblings.
+
+"""
+
+from email.utils import parsedate_tz, mktime_tz
+
+from twisted.internet import defer, reactor
+from twisted.python import failure, log
+
+from riakasaurus.metadata import *
+from riakasaurus.cache import _copy_result
+
+
+def last_modified(obj):
+    """
+    When obj was last modified, in seconds since the epoch. PBC reports
+    microseconds, HTTP whole seconds.
+    """
+    metadata = obj.get_metadata()
+    lastmod = metadata.get(MD_LASTMOD)
+    if lastmod is None:
+        return 0
+    if isinstance(lastmod, basestring):
+        parsed = parsedate_tz(lastmod)
+        return parsed and mktime_tz(parsed) or 0
+    return lastmod + metadata.get(MD_LASTMOD_USECS, 0) / 1000000.0
+
+
+def last_write_wins(siblings):
+    """
+    Resolver keeping the sibling modified last, tombstones only win if
+    all the siblings are.
+    """
+    alive = [sibling for sibling in siblings
+             if not sibling.get_metadata().get(MD_DELETED)]
+    return max(alive or siblings, key=lambda sibling: (
+        last_modified(sibling), sibling.get_metadata().get(MD_VTAG)))
+
+
+class WriteBack(object):
+    """
+    Stores resolved objects back to Riak in the background, so the
+    siblings are gone for the next reader. Write-backs are collected for
+    DELAY seconds and a key resolved several times meanwhile is written
+    once, with its latest resolution. A key being written is held back
+    for the next batch. At most CONCURRENCY stores run at the same time.
+    """
+    DELAY = 0.1     # in seconds
+    CONCURRENCY = 10
+
+    def __init__(self, delay=None, concurrency=None, clock=None):
+        if delay is None:
+            delay = self.DELAY
+        self.delay = delay
+        self._clock = clock or reactor
+        self._sem = defer.DeferredSemaphore(concurrency or self.CONCURRENCY)
+        self._pending = {}
+        self._writing = set()
+        self._call = None
+        self._stats = {
+            'scheduled': 0,
+            'merged': 0,
+            'written': 0,
+            'failed': 0,
+        }
+
+    def schedule(self, obj):
+        """
+        Write obj back with the vclock it was fetched with. It is copied,
+        the caller may go on modifying it.
+        """
+        key = (obj.get_bucket().get_name(), obj.get_key())
+        self._stats['scheduled'] += 1
+        if key in self._pending:
+            self._stats['merged'] += 1
+        self._pending[key] = _snapshot(obj)
+        self._schedule()
+
+    def _schedule(self):
+        if self._call is None and self._pending:
+            self._call = self._clock.callLater(self.delay, self.flush)
+
+    def flush(self):
+        """
+        Write the pending objects now. Returns a deferred firing once
+        they have been written.
+        """
+        if self._call is not None and self._call.active():
+            self._call.cancel()
+        self._call = None
+
+        ds = []
+        for key, obj in self._pending.items():
+            if key in self._writing:
+                continue
+            del self._pending[key]
+            self._writing.add(key)
+            d = self._sem.run(obj.store, return_body=False)
+            ds.append(d.addBoth(self._written, key))
+        self._schedule()
+        return defer.DeferredList(ds)
+
+    def _written(self, result, key):
+        self._writing.discard(key)
+        if isinstance(result, failure.Failure):
+            self._stats['failed'] += 1
+            log.err(result, 'writing back resolved %s/%s' % key)
+        else:
+            self._stats['written'] += 1
+        self._schedule()
+
+    def stats(self):
+        """
+        Return the write-back counters and the number of pending ones
+        """
+        stats = dict(self._stats)
+        stats['pending'] = len(self._pending)
+        return stats
+
+
+def _snapshot(obj):
+    """
+    A copy of obj to be stored as it is now.
+    """
+    vclock, [(metadata, data)] = _copy_result(
+        (obj.vclock(), [(obj.get_metadata(), obj.get_encoded_data())]))
+    copy = obj.__class__(obj._client, obj.get_bucket(), obj.get_key())
+    copy._encode_data = False
+    copy.populate((vclock, [(metadata, data)]))
+    return copy
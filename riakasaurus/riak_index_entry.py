@@ -19,7 +19,9 @@ under the License.
 """
 
 
-class RiakIndexEntry:
+class RiakIndexEntry(object):
+    __slots__ = ('_field', '_value')
+
     def __init__(self, field, value):
         self._field = field
         self._value = str(value)
@@ -42,6 +44,9 @@ class RiakIndexEntry:
             self.get_field() == other.get_field() and \
             self.get_value() == other.get_value()
 
+    def __hash__(self):
+        return hash((self._field, self._value))
+
     def __cmp__(self, other):
         if other == None:
             raise TypeError("RiakIndexEntry cannot be compared to None")
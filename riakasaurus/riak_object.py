@@ -19,7 +19,6 @@ under the License.
 """
 
 import types
-import copy
 
 from twisted.internet import defer
 
@@ -33,6 +32,11 @@ class RiakObject(object):
     The RiakObject holds meta information about a Riak object, plus the
     object's data.
     """
+    # no per instance dict, large result sets hold many of these
+    __slots__ = ('_client', '_bucket', '_key', '_encode_data', '_vclock',
+                 '_data', '_encoded', '_metadata', '_siblings', '_exists',
+                 '__weakref__')
+
     def __init__(self, client, bucket, key=None):
         """
         Construct a new RiakObject.
@@ -58,8 +62,9 @@ class RiakObject(object):
         self._encode_data = True
         self._vclock = None
         self._data = None
+        # (decoder, data) until get_data() decodes data
+        self._encoded = None
         self._metadata = {MD_USERMETA: {}, MD_INDEX: []}
-        self._links = []
         self._siblings = []
         self._exists = False
 
@@ -89,6 +94,10 @@ class RiakObject(object):
 
         :rtype: array or string
         """
+        if self._encoded is not None:
+            decoder, data = self._encoded
+            self._data = decoder(data)
+            self._encoded = None
         return self._data
 
     def set_data(self, data):
@@ -104,6 +113,7 @@ class RiakObject(object):
         :rtype: data
         """
         self._data = data
+        self._encoded = None
         if MD_CTYPE not in self._metadata:
             if self._encode_data:
                 self.set_content_type("application/json")
@@ -115,6 +125,9 @@ class RiakObject(object):
         """
         Get the data encoded for storing
         """
+        if self._encoded is not None:
+            # never decoded, so unchanged
+            return self._encoded[1]
         if self._encode_data == True:
             content_type = self.get_content_type()
             encoder = self._bucket.get_encoder(content_type)
@@ -133,8 +146,10 @@ class RiakObject(object):
     def set_encoded_data(self, data):
         """
         Set the object data from an encoded string. Make sure
-        the metadata has been set correctly first.
+        the metadata has been set correctly first. The data is only
+        decoded when first asked for.
         """
+        self._encoded = None
         if self._encode_data == True:
             content_type = self.get_content_type()
             decoder = self._bucket.get_decoder(content_type)
@@ -143,7 +158,8 @@ class RiakObject(object):
                 # application to handle
                 self._data = data
             else:
-                self._data = decoder(data)
+                self._data = None
+                self._encoded = (decoder, data)
         else:
             self._data = data
         return self
@@ -401,6 +417,12 @@ class RiakObject(object):
         contains a newer version of the object according to the object's
         vector clock.
 
+        Data set from a file or an IBodyProducer, see
+        :func:`RiakBucket.new_binary <riakasaurus.bucket.RiakBucket.new_binary>`,
+        is streamed to Riak over HTTP and read into memory for Protocol
+        Buffers. Without return_body, get_data() keeps returning that file
+        or producer afterwards rather than the stored bytes.
+
         :param w: W-value, wait for this many partitions to respond
                   before returning to client.
         :type w: integer
@@ -426,16 +448,19 @@ class RiakObject(object):
         t = self._client.get_transport()
 
         if self._key is None:
-            key, vclock, metadata = yield t.put_new(self, w=w, dw=dw, pw=pw,
+            key, Result = yield t.put_new(self, w=w, dw=dw, pw=pw,
                 return_body=return_body, if_none_match=if_none_match)
 
             self._exists = True
             self._key = key
-            self._vclock = vclock
-            self.set_metadata(metadata)
+            if Result is not None:
+                self.populate(Result)
         else:
-            Result = yield t.put(self, w=w, dw=dw, pw=pw,
-                return_body=return_body, if_none_match=if_none_match)
+            try:
+                Result = yield t.put(self, w=w, dw=dw, pw=pw,
+                    return_body=return_body, if_none_match=if_none_match)
+            finally:
+                self._invalidate_cache()
 
             if Result is not None:
                 self.populate(Result)
@@ -457,8 +482,45 @@ class RiakObject(object):
         # Do the request...
         r = self._bucket.get_r(r)
         pr = self._bucket.get_pr(pr)
+        cache = self._bucket.get_cache()
+        if cache is not None and vtag is None:
+            Result = yield cache.get(self, r=r, pr=pr)
+        else:
+            Result = yield self._fetch(r=r, pr=pr, vtag=vtag)
+
+        self.clear()
+        if Result is not None:
+            self.populate(Result)
+
+        defer.returnValue(self)
+
+    def _fetch(self, **kwargs):
+        t = self._client.get_transport()
+        inflight = self._client._inflight_gets
+        if inflight is not None:
+            return inflight.get(t, self, **kwargs)
+        return t.get(self, **kwargs)
+
+    @defer.inlineCallbacks
+    def stream(self, consumer, r=None, pr=None, vtag=None):
+        """
+        Reload the object from Riak like reload(), but write the value to
+        consumer as it arrives instead of keeping it in the object. The
+        consumer (an IConsumer) may pause and resume the transfer. Once
+        done, the object holds the metadata only. Nothing is written for
+        an object with siblings.
+
+        :param consumer: Where the value is written to.
+        :type consumer: IConsumer
+        :param r: R-Value, wait for this many partitions to respond
+         before returning to client.
+        :type r: integer
+        :rtype: self
+        """
+        r = self._bucket.get_r(r)
+        pr = self._bucket.get_pr(pr)
         t = self._client.get_transport()
-        Result = yield t.get(self, r=r, pr=pr, vtag=vtag)
+        Result = yield t.stream_get(self, consumer, r=r, pr=pr, vtag=vtag)
 
         self.clear()
         if Result is not None:
@@ -524,19 +586,27 @@ class RiakObject(object):
         pr = self._bucket.get_pr(pr)
         pw = self._bucket.get_pw(pw)
         t = self._client.get_transport()
-        Result = yield t.delete(self, rw=rw, r=r, w=w, dw=dw, pr=pr, pw=pw)
+        try:
+            Result = yield t.delete(self, rw=rw, r=r, w=w, dw=dw, pr=pr,
+                                    pw=pw)
+        finally:
+            self._invalidate_cache()
         self.clear()
         defer.returnValue(self)
 
+    def _invalidate_cache(self):
+        cache = self._bucket.get_cache()
+        if cache is not None:
+            cache.invalidate(self._key)
+
     def clear(self):
         """
         Reset this object.
 
         :rtype: self
         """
-        self._headers = []
-        self._links = []
         self._data = None
+        self._encoded = None
         self._exists = False
         self._siblings = []
         return self
@@ -570,7 +640,9 @@ class RiakObject(object):
             if len(contents) > 0:
                 (metadata, data) = contents.pop(0)
                 self._exists = True
-                if not (MD_INDEX in metadata):
+                # LazyMetadata always builds an index list
+                if not isinstance(metadata, LazyMetadata) and \
+                        MD_INDEX not in metadata:
                     metadata[MD_INDEX] = []
                 self.set_metadata(metadata)
                 if data:        # needed for HEAD support
@@ -578,16 +650,42 @@ class RiakObject(object):
                 # Create objects for all siblings
                 siblings = [self]
                 for (metadata, data) in contents:
-                    sibling = copy.copy(self)
+                    sibling = RiakObject(self._client, self._bucket,
+                                         self._key)
+                    sibling._encode_data = self._encode_data
+                    sibling._vclock = vclock
+                    sibling._exists = True
                     sibling.set_metadata(metadata)
                     sibling.set_encoded_data(data)
                     siblings.append(sibling)
                 for sibling in siblings:
                     sibling.set_siblings(siblings)
+                if len(siblings) > 1:
+                    self._resolve(siblings)
         else:
             raise RiakError("do not know how to handle type " +
                             str(type(Result)))
 
+    def _resolve(self, siblings):
+        """
+        Turn this object into the sibling chosen by the resolver of its
+        bucket, if any.
+        """
+        resolver, write_back = self._bucket._resolution()
+        if resolver is None:
+            return
+        resolved = resolver(list(siblings))
+        if resolved is None:
+            return
+
+        if resolved is not self:
+            self._metadata = resolved._metadata
+            self._data = resolved._data
+            self._encoded = resolved._encoded
+        self._siblings = []
+        if write_back and not self._metadata.get(MD_DELETED):
+            self._client.get_write_back().schedule(self)
+
     def has_siblings(self):
         """
         Return True if this object has siblings.
@@ -626,29 +724,33 @@ class RiakObject(object):
             # Run the request...
             vtag = self._siblings[i]
             obj = RiakObject(self._client, self._bucket, self._key)
+            obj._encode_data = self._encode_data
             yield obj.reload(r=r, pr=pr, vtag=vtag)
 
-            # And make sure it knows who it's siblings are
+            # And make sure it knows who it's siblings are, without
+            # reordering the list other fetches may be filling in
             self._siblings[i] = obj
-            obj.set_siblings(self._siblings)
+            obj._siblings = self._siblings
             defer.returnValue(obj)
 
-    @defer.inlineCallbacks
-    def get_siblings(self, r=None):
+    def get_siblings(self, r=None, pr=None):
         """
-        Retrieve an array of siblings.
+        Retrieve an array of siblings. Usually all of them came with the
+        object, the ones which did not are fetched concurrently.
 
         :param r: R-Value. Wait until this many partitions have
             responded before returning to client.
         :type r: integer
-        :rtype: array of RiakObject
+        :param pr: PR-Value. Require this many primary partitions
+            to be available.
+        :type pr: integer
+        :rtype: array of RiakObject - via deferred
         """
-        a = []
-
-        for i in range(self.get_sibling_count()):
-            b = yield self.get_sibling(i, r)
-
-        defer.returnValue(self._siblings)
+        ds = [self.get_sibling(i, r, pr)
+              for i in range(self.get_sibling_count())]
+        d = defer.DeferredList(ds, fireOnOneErrback=True, consumeErrors=True)
+        d.addErrback(lambda f: f.value.subFailure)
+        return d.addCallback(lambda _: self._siblings)
 
     def set_siblings(self, siblings):
         """
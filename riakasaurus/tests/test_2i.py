@@ -55,6 +55,8 @@ class Tests(unittest.TestCase):
     def tearDown(self):
         yield self.bucket.disable_search()
         yield self.bucket.purge_keys()
+        # close persistent HTTP connections
+        yield self.client.get_transport().quit()
 
     @defer.inlineCallbacks
     def test_secondary_index_mapred(self):
@@ -124,3 +126,69 @@ class Tests(unittest.TestCase):
                          ['foo1', 'foo\xe2\x98\x83'])
 
         log.msg("done secondary_index")
+
+    @defer.inlineCallbacks
+    def test_index_pages(self):
+        for i in range(10):
+            obj = self.bucket.new('foo%d' % i, {'field2': 1000 + i})
+            obj.add_index('field2_int', 1000 + i)
+            yield obj.store()
+
+        page = yield self.bucket.index_pages('field2_int', 1000, 1009,
+                                             max_results=4)
+        keys = list(page)
+        self.assertEqual(len(page), 4)
+        while page.has_next_page():
+            page = yield page.next_page()
+            keys.extend(page)
+        self.assertEqual(keys, ['foo%d' % i for i in range(10)])
+
+        page = yield self.bucket.index_pages('field2_int', 1000, 1009,
+                                             max_results=4,
+                                             return_terms=True)
+        self.assertEqual(page.results,
+                         [(str(1000 + i), 'foo%d' % i) for i in range(4)])
+
+    @defer.inlineCallbacks
+    def test_stream_index(self):
+        for i in range(10):
+            obj = self.bucket.new('foo%d' % i, {'field2': 1000 + i})
+            obj.add_index('field2_int', 1000 + i)
+            yield obj.store()
+
+        keys = []
+        decoded = []
+
+        def decoder(s):
+            decoded.append(s)
+            return json.loads(s)
+        self.client.set_decoder('application/json', decoder)
+
+        continuation = yield self.bucket.stream_index(
+            keys.extend, 'field2_int', 1000, 1009, max_results=6)
+        self.assertEqual(keys, ['foo%d' % i for i in range(6)])
+        self.assertTrue(decoded)
+
+        continuation = yield self.bucket.stream_index(
+            keys.extend, 'field2_int', 1000, 1009, max_results=6,
+            continuation=continuation)
+        self.assertEqual(continuation, None)
+        self.assertEqual(keys, ['foo%d' % i for i in range(10)])
+
+    @defer.inlineCallbacks
+    def test_stream_index_objects(self):
+        for i in range(10):
+            obj = self.bucket.new('foo%d' % i, {'field2': 1000 + i})
+            obj.add_index('field2_int', 1000 + i)
+            yield obj.store()
+
+        fetched = {}
+
+        def gotObject(key, obj):
+            fetched[key] = obj.get_data()
+
+        continuation = yield self.bucket.stream_index_objects(
+            gotObject, 'field2_int', 1000, 1009, concurrency=3)
+        self.assertEqual(continuation, None)
+        self.assertEqual(fetched, dict(('foo%d' % i, {'field2': 1000 + i})
+                                       for i in range(10)))
@@ -76,3 +76,61 @@ class Tests(unittest.TestCase):
                          ['foo1', 'foo2'])
 
         log.msg("done secondary_index")
+
+    @defer.inlineCallbacks
+    def test_index_pages(self):
+        for i in range(10):
+            obj = self.bucket.new('foo%d' % i, {'field2': 1000 + i})
+            obj.add_index('field2_int', 1000 + i)
+            yield obj.store()
+
+        page = yield self.bucket.index_pages('field2_int', 1000, 1009,
+                                             max_results=4)
+        keys = list(page)
+        self.assertEqual(len(page), 4)
+        while page.has_next_page():
+            page = yield page.next_page()
+            keys.extend(page)
+        self.assertEqual(keys, ['foo%d' % i for i in range(10)])
+
+        page = yield self.bucket.index_pages('field2_int', 1000, 1009,
+                                             max_results=4,
+                                             return_terms=True)
+        self.assertEqual(page.results,
+                         [(str(1000 + i), 'foo%d' % i) for i in range(4)])
+
+    @defer.inlineCallbacks
+    def test_stream_index(self):
+        for i in range(10):
+            obj = self.bucket.new('foo%d' % i, {'field2': 1000 + i})
+            obj.add_index('field2_int', 1000 + i)
+            yield obj.store()
+
+        keys = []
+        continuation = yield self.bucket.stream_index(
+            keys.extend, 'field2_int', 1000, 1009, max_results=6)
+        self.assertEqual(keys, ['foo%d' % i for i in range(6)])
+
+        continuation = yield self.bucket.stream_index(
+            keys.extend, 'field2_int', 1000, 1009, max_results=6,
+            continuation=continuation)
+        self.assertEqual(continuation, None)
+        self.assertEqual(keys, ['foo%d' % i for i in range(10)])
+
+    @defer.inlineCallbacks
+    def test_stream_index_objects(self):
+        for i in range(10):
+            obj = self.bucket.new('foo%d' % i, {'field2': 1000 + i})
+            obj.add_index('field2_int', 1000 + i)
+            yield obj.store()
+
+        fetched = {}
+
+        def gotObject(key, obj):
+            fetched[key] = obj.get_data()
+
+        continuation = yield self.bucket.stream_index_objects(
+            gotObject, 'field2_int', 1000, 1009, concurrency=3)
+        self.assertEqual(continuation, None)
+        self.assertEqual(fetched, dict(('foo%d' % i, {'field2': 1000 + i})
+                                       for i in range(10)))
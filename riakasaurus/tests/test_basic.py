@@ -115,6 +115,8 @@ class Tests_HTTP(unittest.TestCase, BasicTestsMixin):
     def tearDown(self):
         yield self.bucket.disable_search()
         yield self.bucket.purge_keys()
+        # close persistent HTTP connections
+        yield self.client.get_transport().quit()
 
     @defer.inlineCallbacks
     def test_reset_bucket_properties(self):
@@ -156,6 +158,42 @@ class Tests_HTTP(unittest.TestCase, BasicTestsMixin):
                 raise
         log.msg('done reset_bucket_properties_not_available')
 
+    @defer.inlineCallbacks
+    def test_server_version_detected_once(self):
+        """concurrent capability checks share one version request"""
+        log.msg('*** server_version_detected_once')
+        transport = self.client.get_transport()
+        calls = []
+        fetch = transport._server_version
+
+        def counting():
+            calls.append(1)
+            return fetch()
+        self.patch(transport, '_s_version', None)
+        self.patch(transport, '_server_version', counting)
+
+        yield defer.gatherResults(
+            [transport.tombstone_vclocks() for i in range(50)])
+        self.assertEqual(len(calls), 1)
+
+        transport.set_server_version('1.2.0')
+        version = yield transport.server_version()
+        self.assertEqual(version, LooseVersion('1.2.0'))
+        self.assertEqual(len(calls), 1)
+        log.msg('done server_version_detected_once')
+
+    @defer.inlineCallbacks
+    def test_connection_reuse(self):
+        """Sequential requests share a persistent connection."""
+        log.msg('*** connection_reuse')
+        transport = self.client.get_transport()
+        before = transport.pool_stats()
+        yield self.client.is_alive()
+        yield self.client.is_alive()
+        after = transport.pool_stats()
+        self.assertTrue(after['hits'] > before['hits'])
+        log.msg('done connection_reuse')
+
     @defer.inlineCallbacks
     def test_request_timeout(self):
         """Timeouts are respected."""
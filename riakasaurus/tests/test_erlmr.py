@@ -55,6 +55,8 @@ class Tests(unittest.TestCase):
     def tearDown(self):
         yield self.bucket.disable_search()
         yield self.bucket.purge_keys()
+        # close persistent HTTP connections
+        yield self.client.get_transport().quit()
 
     @defer.inlineCallbacks
     def test_erlang_map_reduce(self):
@@ -81,6 +83,50 @@ class Tests(unittest.TestCase):
         self.assertEqual(len(result), 2)
         log.msg('done erlang_map_reduce')
 
+    @defer.inlineCallbacks
+    def test_stream_map_reduce(self):
+        """stream erlang map reduce results"""
+        log.msg('*** stream_map_reduce')
+        yield self.bucket.new("foo", 2).store()
+        yield self.bucket.new("bar", 2).store()
+        yield self.bucket.new("baz", 4).store()
+
+        results = []
+        decoded = []
+
+        def gotResults(phase, data):
+            self.assertEqual(phase, 0)
+            results.extend(data)
+
+        def decoder(s):
+            decoded.append(s)
+            return json.loads(s)
+        # the results are decoded like those of run()
+        self.client.set_decoder('application/json', decoder)
+
+        yield self.client \
+            .add(self.bucket_name, "foo") \
+            .add(self.bucket_name, "bar") \
+            .add(self.bucket_name, "baz") \
+            .map(["riak_kv_mapreduce", "map_object_value"]) \
+            .stream(gotResults)
+        self.assertEqual(sorted(results), [2, 2, 4])
+        self.assertTrue(decoded)
+        log.msg('done stream_map_reduce')
+
+    @defer.inlineCallbacks
+    def test_phaseless_map_reduce(self):
+        """map reduce without phases returns its inputs"""
+        log.msg('*** phaseless_map_reduce')
+        yield self.bucket.new("foo", 2).store()
+        transport = self.client.get_transport()
+        for query in ([], None):
+            result = yield transport.mapred([[self.bucket_name, "foo"]],
+                                            query)
+            self.assertEqual([r[:2] for r in result],
+                             [[self.bucket_name, "foo"]])
+        log.msg('done phaseless_map_reduce')
+
     @defer.inlineCallbacks
     def test_map_reduce_from_object(self):
         """map reduce from an object"""
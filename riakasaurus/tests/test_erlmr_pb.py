@@ -0,0 +1,33 @@
+from twisted.internet import defer
+from twisted.python import log
+
+from test_erlmr import Tests
+from riakasaurus import riak, transport
+
+RIAK_CLIENT_ID = 'TEST'
+BUCKET_PREFIX = 'riakasaurus.tests.'
+
+VERBOSE = False
+# uncomment to activate logging
+if VERBOSE:
+    import sys
+    log.startLogging(sys.stderr)
+
+
+class Tests_PB(Tests):
+
+    @defer.inlineCallbacks
+    def setUp(self):
+        self.client = riak.RiakClient(client_id=RIAK_CLIENT_ID,
+                                      host='127.0.0.1',
+                                      port=8087,
+                                      transport=transport.PBCTransport)
+        self.bucket_name = BUCKET_PREFIX + self.id().rsplit('.', 1)[-1]
+        self.bucket = self.client.bucket(self.bucket_name)
+        yield self.bucket.purge_keys()
+
+    @defer.inlineCallbacks
+    def tearDown(self):
+        yield self.bucket.purge_keys()
+        # shut down pb connection explicitly
+        yield self.client.get_transport().quit()
@@ -55,6 +55,8 @@ class Tests(unittest.TestCase):
     def tearDown(self):
         yield self.bucket.disable_search()
         yield self.bucket.purge_keys()
+        # close persistent HTTP connections
+        yield self.client.get_transport().quit()
 
     @defer.inlineCallbacks
     def test_javascript_source_map(self):
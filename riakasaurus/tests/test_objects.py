@@ -9,11 +9,17 @@ import json
 import random
 from twisted.trial import unittest
 from twisted.python import log
-from twisted.internet import defer
+from twisted.internet import defer, reactor, task
+from twisted.test import proto_helpers
 
 VERBOSE = False
 
 from riakasaurus import riak
+from riakasaurus.cache import InflightGets
+from riakasaurus.mapreduce import RiakLink
+from riakasaurus.metrics import RiakMetrics
+from riakasaurus.resolver import last_write_wins
+from riakasaurus.riak_index_entry import RiakIndexEntry
 
 # uncomment to activate logging
 # import sys
@@ -54,6 +60,8 @@ class Tests(unittest.TestCase):
     def tearDown(self):
         yield self.bucket.disable_search()
         yield self.bucket.purge_keys()
+        # close persistent HTTP connections
+        yield self.client.get_transport().quit()
 
     @defer.inlineCallbacks
     def test_set_data_empty(self):
@@ -112,6 +120,26 @@ class Tests(unittest.TestCase):
         keys = yield self.bucket.list_keys()
         self.assertEqual(["foo1", "foo2"], sorted(keys))
 
+    @defer.inlineCallbacks
+    def test_stream_keys(self):
+        """Test streaming all keys in bucket."""
+        log.msg("*** stream_keys")
+
+        obj = self.bucket.new("foo1", "test1")
+        yield obj.store()
+        obj1 = self.bucket.new("foo2", "test2")
+        yield obj1.store()
+
+        keys = []
+
+        def gotKeys(chunk):
+            keys.extend(chunk)
+            # reading is paused until the returned deferred fires
+            return task.deferLater(reactor, 0, lambda: None)
+
+        yield self.bucket.stream_keys(gotKeys)
+        self.assertEqual(["foo1", "foo2"], sorted(keys))
+
     @defer.inlineCallbacks
     def test_purge_keys(self):
         """Test purging all keys in a bucket."""
@@ -135,6 +163,32 @@ class Tests(unittest.TestCase):
             time.sleep(0.2)
         self.assertEqual([], keys)
 
+    @defer.inlineCallbacks
+    def test_purge_keys_progress(self):
+        """Test purging keys concurrently, reporting progress."""
+        log.msg("*** purge_keys_progress")
+        keys = ['foo%d' % i for i in range(30)]
+        yield self.client.multiput([self.bucket.new(key, 'test')
+                                    for key in keys])
+
+        purged = []
+        deleted = yield self.bucket.purge_keys(
+            concurrency=5, callback=lambda key, result: purged.append(key))
+        self.assertEqual(deleted, 30)
+        self.assertEqual(sorted(purged), sorted(keys))
+
+        # an exception raised by the callback is reported once all keys
+        # have been tried
+        yield self.client.multiput([self.bucket.new(key, 'test')
+                                    for key in keys])
+
+        def fail(key, result):
+            raise ValueError(key)
+        d = self.bucket.purge_keys(concurrency=5, callback=fail)
+        yield self.assertFailure(d, ValueError)
+        keys = yield self.bucket.get_keys()
+        self.assertEqual(keys, [])
+
     @defer.inlineCallbacks
     def test_store_and_get(self):
         """Store and get text data."""
@@ -179,6 +233,178 @@ class Tests(unittest.TestCase):
         self.assertEqual(data, json.loads(obj.get_data()))
         log.msg('done binary_store_and_get')
 
+    @defer.inlineCallbacks
+    def test_binary_store_from_file(self):
+        """store binary data streamed from a file."""
+        log.msg('*** binary_store_from_file')
+        data = ''.join(chr(i % 256) for i in range(256 * 1024))
+        filename = self.mktemp()
+        with open(filename, 'wb') as f:
+            f.write(data)
+
+        obj = self.bucket.new_binary_from_file('foo1', filename)
+        yield obj.store(return_body=False)
+
+        obj = yield self.bucket.get_binary('foo1')
+        self.assertEqual(obj.get_data(), data)
+
+        # the file is opened again for every store
+        obj = self.bucket.new_binary_from_file('foo2', filename)
+        yield obj.store(return_body=False)
+        with open(filename, 'wb') as f:
+            f.write('changed')
+        yield obj.store(return_body=False)
+        obj = yield self.bucket.get_binary('foo2')
+        self.assertEqual(obj.get_data(), 'changed')
+
+        # an open file is sent from where it was, and left open
+        with open(filename, 'rb') as f:
+            f.read(2)
+            obj = self.bucket.new_binary('foo3', f)
+            yield obj.store(return_body=False)
+            yield obj.store(return_body=False)
+            self.assertFalse(f.closed)
+        obj = yield self.bucket.get_binary('foo3')
+        self.assertEqual(obj.get_data(), 'anged')
+        log.msg('done binary_store_from_file')
+
+    @defer.inlineCallbacks
+    def test_lazy_decoding(self):
+        """data is only decoded when asked for."""
+        log.msg('*** lazy_decoding')
+        decoded = []
+
+        def decoder(s):
+            decoded.append(s)
+            return json.loads(s)
+        self.bucket.set_decoder('application/json', decoder)
+
+        obj = self.bucket.new('foo1', {'a': 1})
+        obj.set_usermeta({'colour': 'red'})
+        obj.add_index('number_int', 7)
+        yield obj.store(return_body=False)
+
+        obj = yield self.bucket.get('foo1')
+        self.assertEqual(obj.get_usermeta(), {'colour': 'red'})
+        self.assertEqual(obj.get_indexes('number_int'), ['7'])
+        self.assertEqual(decoded, [])
+        self.assertEqual(obj.get_data(), {'a': 1})
+        self.assertEqual(obj.get_data(), {'a': 1})
+        self.assertEqual(len(decoded), 1)
+
+        # stored again as fetched
+        yield obj.store(return_body=False)
+        self.assertEqual(len(decoded), 1)
+        log.msg('done lazy_decoding')
+
+    @defer.inlineCallbacks
+    def test_object_cache(self):
+        """cached objects are revalidated and invalidated on store."""
+        log.msg('*** object_cache')
+        cache = self.bucket.enable_cache()
+        self.addCleanup(self.bucket.disable_cache)
+
+        yield self.bucket.new('foo1', {'a': [1]}).store(return_body=False)
+        obj = yield self.bucket.get('foo1')
+        obj.get_data()['a'].append(2)
+
+        obj = yield self.bucket.get('foo1')
+        self.assertEqual(obj.get_data(), {'a': [1]})
+        self.assertEqual(cache.stats()['unchanged'], 1)
+
+        obj.set_data({'a': [3]})
+        yield obj.store(return_body=False)
+        obj = yield self.bucket.get('foo1')
+        self.assertEqual(obj.get_data(), {'a': [3]})
+        self.assertEqual(cache.stats()['misses'], 2)
+
+        yield obj.delete()
+        obj = yield self.bucket.get('foo1')
+        self.assertFalse(obj.exists())
+        log.msg('done object_cache')
+
+    @defer.inlineCallbacks
+    def test_object_cache_eviction(self):
+        """the least recently used objects are evicted."""
+        log.msg('*** object_cache_eviction')
+        cache = self.bucket.enable_cache(size=2)
+        self.addCleanup(self.bucket.disable_cache)
+
+        for key in ('foo1', 'foo2', 'foo3'):
+            yield self.bucket.new(key, key).store(return_body=False)
+        for key in ('foo1', 'foo2', 'foo1', 'foo3'):
+            yield self.bucket.get(key)
+        self.assertEqual(len(cache), 2)
+        self.assertEqual(cache.stats()['evictions'], 1)
+
+        # foo2 was evicted, foo1 and foo3 are revalidated
+        for key in ('foo1', 'foo3', 'foo2'):
+            obj = yield self.bucket.get(key)
+            self.assertEqual(obj.get_data(), key)
+        self.assertEqual(cache.stats()['unchanged'], 3)
+        self.assertEqual(cache.stats()['misses'], 4)
+        log.msg('done object_cache_eviction')
+
+    @defer.inlineCallbacks
+    def test_coalesced_gets(self):
+        """concurrent gets of the same object share one request."""
+        log.msg('*** coalesced_gets')
+        inflight = InflightGets()
+        self.patch(self.client, '_inflight_gets', inflight)
+
+        yield self.bucket.new('foo1', {'a': [1]}).store(return_body=False)
+        objs = yield defer.gatherResults(
+            [self.bucket.get('foo1') for i in range(10)])
+        objs[0].get_data()['a'].append(2)
+
+        self.assertEqual(objs[9].get_data(), {'a': [1]})
+        self.assertEqual(inflight.stats()['requests'], 1)
+        self.assertEqual(inflight.stats()['coalesced'], 9)
+        log.msg('done coalesced_gets')
+
+    @defer.inlineCallbacks
+    def test_metrics(self):
+        """requests are reported to the metrics collector."""
+        log.msg('*** metrics')
+        metrics = RiakMetrics()
+        client = riak.RiakClient(client_id=RIAK_CLIENT_ID,
+                                 host=self.client._host,
+                                 port=self.client._port,
+                                 transport=self.client.transport.__class__,
+                                 metrics=metrics)
+        self.addCleanup(client.get_transport().quit)
+        bucket = client.bucket(self.bucket_name)
+
+        yield bucket.new('foo1', {'a': 1}).store(return_body=False)
+        for i in range(3):
+            obj = yield bucket.get('foo1')
+        yield obj.delete()
+
+        stats = metrics.snapshot()
+        self.assertEqual(stats['requests']['get'][self.bucket_name]['count'],
+                         3)
+        self.assertEqual(stats['requests']['put'][self.bucket_name]['count'],
+                         1)
+        self.assertEqual(stats['requests']['del'][self.bucket_name]['errors'],
+                         0)
+        self.assertTrue(stats['bytes_received'] > 0)
+        log.msg('done metrics')
+
+    @defer.inlineCallbacks
+    def test_stream_binary(self):
+        """stream binary data into a consumer."""
+        log.msg('*** stream_binary')
+        data = ''.join(chr(i % 256) for i in range(256 * 1024))
+        yield self.bucket.new_binary('foo1', data).store()
+
+        consumer = proto_helpers.StringTransport()
+        obj = yield self.bucket.stream_binary('foo1', consumer)
+        self.assertEqual(obj.exists(), True)
+        self.assertEqual(obj.get_data(), None)
+        self.assertEqual(consumer.value(), data)
+        self.assertEqual(consumer.producer, None)
+        log.msg('done stream_binary')
+
     @defer.inlineCallbacks
     def test_missing_object(self):
         """handle missing objects."""
@@ -188,6 +414,56 @@ class Tests(unittest.TestCase):
         self.assertEqual(obj.get_data(), None)
         log.msg('done missing_object')
 
+    @defer.inlineCallbacks
+    def test_multiget(self):
+        """get several objects at once"""
+        log.msg('*** multiget')
+        keys = ['foo%d' % i for i in range(10)]
+        for key in keys:
+            yield self.bucket.new(key, key).store()
+
+        streamed = []
+        objs = yield self.bucket.multiget(keys + ['missing'], concurrency=3,
+            callback=lambda key, obj: streamed.append(key))
+        self.assertEqual(sorted(objs.keys()), sorted(keys + ['missing']))
+        self.assertEqual(sorted(streamed), sorted(objs.keys()))
+        for key in keys:
+            self.assertEqual(objs[key].get_data(), key)
+        self.assertEqual(objs['missing'].exists(), False)
+        log.msg('done multiget')
+
+    @defer.inlineCallbacks
+    def test_multiput(self):
+        """store several objects at once"""
+        log.msg('*** multiput')
+        keys = ['foo%d' % i for i in range(10)]
+        objs = [self.bucket.new(key, key) for key in keys]
+        res = yield self.client.multiput(objs, concurrency=3)
+        self.assertEqual(res, [(True, obj) for obj in objs])
+
+        objs = yield self.bucket.multiget(keys)
+        for key in keys:
+            self.assertEqual(objs[key].get_data(), key)
+
+        # Riak generates the keys of objects without one
+        objs = [self.bucket.new(None, i).set_usermeta({'n': str(i)})
+                for i in range(3)]
+        res = yield self.client.multiput(objs)
+        self.assertEqual(res, [(True, obj) for obj in objs])
+        for i, obj in enumerate(objs):
+            self.assertNotEqual(obj.get_key(), None)
+            # keeps the metadata it was stored with
+            self.assertEqual(obj.get_content_type(), 'application/json')
+            self.assertEqual(obj.get_usermeta(), {'n': str(i)})
+            self.assertEqual(obj.get_data(), i)
+            fetched = yield self.bucket.get(obj.get_key())
+            self.assertEqual(fetched.get_data(), i)
+
+        obj = yield self.bucket.new(None, 'body').store(return_body=True)
+        self.assertNotEqual(obj.get_key(), None)
+        self.assertNotEqual(obj.vclock(), None)
+        log.msg('done multiput')
+
     @defer.inlineCallbacks
     def test_delete(self):
         """delete objects"""
@@ -233,6 +509,8 @@ class Tests(unittest.TestCase):
 
         # Test get_sibling()/get_siblings()...
         siblings = yield obj.get_siblings()
+        self.assertEqual(len(siblings), 5)
+        self.assertTrue(all(s.exists() for s in siblings))
         obj3 = yield obj.get_sibling(3)
 
         self.assertEqual(siblings[3].get_data(), obj3.get_data())
@@ -247,6 +525,35 @@ class Tests(unittest.TestCase):
         yield obj.delete()
         log.msg('done siblings')
 
+    @defer.inlineCallbacks
+    def test_resolver(self):
+        """siblings are resolved and written back."""
+        log.msg('*** resolver')
+        yield self.bucket.set_allow_multiples(True)
+        for i in range(3):
+            # a client id of its own for every write makes siblings
+            client = riak.RiakClient(client_id='%s_%d' % (RIAK_CLIENT_ID, i),
+                                     host=self.client._host,
+                                     port=self.client._port,
+                                     transport=self.client.transport.__class__)
+            bucket = client.bucket(self.bucket_name)
+            yield bucket.new('foo', i).store()
+            yield client.get_transport().quit()
+
+        self.bucket.set_resolver(last_write_wins, write_back=True)
+        obj = yield self.bucket.get('foo')
+        self.assertFalse(obj.has_siblings())
+        self.assertEqual(obj.get_data(), 2)
+        yield self.client.get_write_back().flush()
+        self.assertEqual(self.client.get_write_back().stats()['written'], 1)
+
+        self.bucket.set_resolver(None)
+        obj = yield self.bucket.get('foo')
+        self.assertFalse(obj.has_siblings())
+        self.assertEqual(obj.get_data(), 2)
+        yield obj.delete()
+        log.msg('done resolver')
+
     @defer.inlineCallbacks
     def test_store_and_get_links(self):
         """manipulate links"""
@@ -274,6 +581,19 @@ class Tests(unittest.TestCase):
 
         log.msg('done store_and_get_links')
 
+    def test_slots(self):
+        """objects, links and index entries have no attribute dict"""
+        obj = self.bucket.new('foo')
+        link = RiakLink(self.bucket_name, 'foo', 'tag')
+        for thing in (obj, link, RiakIndexEntry('field_int', 1)):
+            self.assertRaises(AttributeError, setattr, thing, 'unknown', 1)
+
+        entries = [RiakIndexEntry('field_int', 1),
+                   RiakIndexEntry('field_int', '1'),
+                   RiakIndexEntry('field_bin', '1')]
+        self.assertEqual(hash(entries[0]), hash(entries[1]))
+        self.assertEqual(len(set(entries)), 2)
+
     @defer.inlineCallbacks
     def test_link_walking(self):
         """walk links"""
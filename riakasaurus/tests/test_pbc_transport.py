@@ -1,7 +1,7 @@
 from twisted.trial import unittest
 from twisted.internet import defer
 
-from riakasaurus import riak, transport
+from riakasaurus import riak, transport, exceptions
 
 
 RIAK_CLIENT_ID = 'TEST'
@@ -13,21 +13,27 @@ class Tests(unittest.TestCase):
     @defer.inlineCallbacks
     def setUp(self):
         self.old_max_transports = transport.PBCTransport.MAX_TRANSPORTS
+        self.old_pipeline_depth = transport.PBCTransport.PIPELINE_DEPTH
+        self.old_max_waiters = transport.PBCTransport.MAX_WAITERS
         transport.PBCTransport.MAX_TRANSPORTS = 3
 
         self.client = riak.RiakClient(client_id=RIAK_CLIENT_ID,
                 port=8087, transport=transport.PBCTransport)
         self.bucket_name = BUCKET_PREFIX + self.id().rsplit('.', 1)[-1]
         self.bucket = self.client.bucket(self.bucket_name)
-        yield self.bucket.purge_keys()
+        # one delete at a time, the pool statistics are checked by tests
+        yield self.bucket.purge_keys(concurrency=1)
 
     @defer.inlineCallbacks
     def tearDown(self):
         transport.PBCTransport.MAX_TRANSPORTS = self.old_max_transports
+        transport.PBCTransport.PIPELINE_DEPTH = self.old_pipeline_depth
+        transport.PBCTransport.MAX_WAITERS = self.old_max_waiters
         yield self.client.get_transport().quit()
 
     @defer.inlineCallbacks
     def test_put_raises_exception_if_max_transports_reached(self):
+        transport.PBCTransport.MAX_WAITERS = 0
         data = 'My data'
         objs = [self.bucket.new_binary(str(i), data) for i in range(4)]
         ds = map(self.put_new, objs)
@@ -37,6 +43,17 @@ class Tests(unittest.TestCase):
                 return
         assert False, 'Should fail because MAX_TRANSPORTS is 3'
 
+    @defer.inlineCallbacks
+    def test_put_waits_for_a_transport_if_max_transports_reached(self):
+        data = 'My data'
+        objs = [self.bucket.new_binary(str(i), data) for i in range(10)]
+        yield defer.DeferredList(map(self.put_new, objs),
+                                 fireOnOneErrback=True)
+        stats = self.client.get_transport().pool_stats()
+        self.assertEqual(stats['transports'], 3)
+        self.assertEqual(stats['waits'], 7)
+        self.assertEqual(stats['waiting'], 0)
+
     @defer.inlineCallbacks
     def test_put_returns_transports_even_if_an_exception_occurs(self):
         data = 'My data'
@@ -55,6 +72,87 @@ class Tests(unittest.TestCase):
         obj = self.bucket.new_binary('my_key', data)
         yield self.put_new(obj)
 
+    @defer.inlineCallbacks
+    def test_requests_are_pipelined_once_max_transports_reached(self):
+        transport.PBCTransport.PIPELINE_DEPTH = 4
+        data = 'My data'
+        objs = [self.bucket.new_binary(str(i), data) for i in range(12)]
+        yield defer.DeferredList(map(self.put_new, objs),
+                                 fireOnOneErrback=True)
+        res = yield defer.DeferredList(
+            [self.bucket.get_binary(str(i)) for i in range(12)],
+            fireOnOneErrback=True)
+        self.assertEqual([obj.get_data() for _, obj in res], [data] * 12)
+        self.assertTrue(
+            self.client.get_transport().pool_stats()['transports'] <= 3)
+
+    @defer.inlineCallbacks
+    def test_unreachable_nodes_are_skipped_and_ejected(self):
+        client = riak.RiakClient(client_id=RIAK_CLIENT_ID,
+                nodes=['127.0.0.1:8087', '127.0.0.1:1'],
+                transport=transport.PBCTransport)
+        try:
+            res = yield defer.DeferredList(
+                [client.get_transport().ping() for i in range(6)],
+                fireOnOneErrback=True)
+            self.assertEqual([r for _, r in res], [True] * 6)
+            nodes = client.get_nodes()
+            self.assertFalse(nodes[0]['ejected'])
+            self.assertTrue(nodes[1]['ejected'])
+        finally:
+            yield client.get_transport().quit()
+
+    @defer.inlineCallbacks
+    def test_fast_decoding_matches_generated_code(self):
+        obj = self.bucket.new('foo', {'a': 1})
+        obj.set_usermeta({'colour': 'red'})
+        obj.add_index('number_int', 7)
+        obj.add_link(self.bucket.new('bar'), 'tag')
+        yield obj.store()
+
+        fetched = []
+        default = transport.PBCTransport.FAST_DECODING
+        for fast in (True, False):
+            transport.PBCTransport.FAST_DECODING = fast
+            try:
+                client = riak.RiakClient(client_id=RIAK_CLIENT_ID,
+                        port=8087, transport=transport.PBCTransport)
+                fetched.append((yield client.bucket(self.bucket_name).get('foo')))
+                yield client.get_transport().quit()
+            finally:
+                transport.PBCTransport.FAST_DECODING = default
+
+        fast, slow = fetched
+        self.assertEqual(fast.get_data(), slow.get_data())
+        self.assertEqual(fast.vclock(), slow.vclock())
+        self.assertEqual(fast.get_usermeta(), {'colour': 'red'})
+        self.assertEqual(fast.get_usermeta(), slow.get_usermeta())
+        self.assertEqual(fast.get_indexes(), slow.get_indexes())
+        self.assertEqual(
+            [(l.get_bucket(), l.get_key(), l.get_tag()) for l in fast.get_links()],
+            [(l.get_bucket(), l.get_key(), l.get_tag()) for l in slow.get_links()])
+
+    @defer.inlineCallbacks
+    def test_timed_out_connection_is_dropped(self):
+        client = riak.RiakClient(client_id=RIAK_CLIENT_ID,
+                port=8087, transport=transport.PBCTransport,
+                request_timeout=0.2)
+        try:
+            yield client.get_transport().ping()
+            pool = client.get_transport()._pools.values()[0]
+            connection = pool._idle[0].getTransport()
+            # the answer to the next request won't be read in time
+            connection.transport.pauseProducing()
+            yield self.assertFailure(client.get_transport().ping(),
+                                     exceptions.RequestTimeout)
+            self.assertTrue(connection.isDisconnected())
+
+            res = yield client.get_transport().ping()
+            self.assertEqual(res, True)
+            self.assertEqual(pool.stats()['transports'], 1)
+        finally:
+            yield client.get_transport().quit()
+
     def put_new(self, obj):
         w = self.bucket.get_w(None)
         dw = self.bucket.get_dw(None)
@@ -4,9 +4,13 @@ from twisted.protocols.basic import LineReceiver
 LineReceiver.MAX_LENGTH = 1024 * 1024 * 64
 
 from twisted.internet import defer, reactor, protocol, error
+from twisted.internet.interfaces import IPushProducer
 from twisted.web.http_headers import Headers
-from twisted.web.client import Agent
+from twisted.web.client import Agent, HTTPConnectionPool, ResponseDone
+from twisted.web.client import FileBodyProducer
+from twisted.web.http import PotentialDataLoss
 from twisted.web.iweb import IBodyProducer
+from twisted.python import failure
 
 # MD_ resources
 from riakasaurus.metadata import *
@@ -15,13 +19,16 @@ from riakasaurus.riak_index_entry import RiakIndexEntry
 from riakasaurus.mapreduce import RiakLink
 from riakasaurus.transport import transport
 from riakasaurus import exceptions
+from riakasaurus.cache import UNCHANGED
 
 from cStringIO import StringIO
 from xml.etree import ElementTree
 
 import urllib
+import time
 import re
 import csv
+import json
 
 MAX_LINK_HEADER_SIZE = 8192 - 8
 
@@ -40,6 +47,252 @@ class BodyReceiver(protocol.Protocol):
         self.finished.callback(self.buffer)
 
 
+class ConsumerReceiver(protocol.Protocol):
+    """
+    Writes a response body to an IConsumer as it arrives. The receiver
+    registers as the consumer's producer, so the consumer can pause and
+    resume the download.
+    """
+    implements(IPushProducer)
+
+    def __init__(self, finished, consumer):
+        self.finished = finished
+        self.consumer = consumer
+
+    def connectionMade(self):
+        self.consumer.registerProducer(self, True)
+
+    def dataReceived(self, data):
+        self.consumer.write(data)
+
+    def pauseProducing(self):
+        self.transport.pauseProducing()
+
+    def resumeProducing(self):
+        self.transport.resumeProducing()
+
+    def stopProducing(self):
+        self.transport.stopProducing()
+
+    def connectionLost(self, reason):
+        self.consumer.unregisterProducer()
+        if reason.check(ResponseDone, PotentialDataLoss):
+            self.finished.callback(None)
+        else:
+            self.finished.errback(reason)
+
+
+class StreamReceiver(protocol.Protocol):
+    """
+    Base for incremental parsers of streamed response bodies. Every chunk
+    returned by nextChunk() is handed to callback as soon as it is
+    complete. If callback returns a deferred, reading is paused until it
+    fires.
+    """
+    def __init__(self, finished, callback):
+        self.finished = finished
+        self.callback = callback
+        self.buffer = ''
+        self.paused = False
+        self.failed = False
+        self.reason = None      # why the body ended, once it did
+
+    def nextChunk(self):
+        """
+        Remove the next complete chunk from self.buffer and return it.
+        None means more data is needed, empty chunks are skipped.
+        """
+        raise NotImplementedError
+
+    def isComplete(self):
+        """
+        Whether the body ended where it should
+        """
+        return not self.buffer.strip()
+
+    def dataReceived(self, data):
+        if not self.failed:
+            self.buffer += data
+            self.processBuffer()
+
+    def processBuffer(self):
+        while not self.paused and not self.failed:
+            try:
+                chunk = self.nextChunk()
+            except Exception:
+                self.fail(failure.Failure())
+                break
+            if chunk is None:
+                break       # need more data
+            if chunk:
+                self.deliver(chunk)
+
+        if not self.paused and self.reason is not None:
+            self.finish()
+
+    def deliver(self, chunk):
+        try:
+            result = self.callback(chunk)
+        except Exception:
+            self.fail(failure.Failure())
+            return
+
+        if isinstance(result, defer.Deferred):
+            result.addErrback(self.fail)
+            if not result.called:
+                self.paused = True
+                self.transport.pauseProducing()
+                result.addBoth(self.resume)
+
+    def resume(self, _):
+        self.paused = False
+        if self.reason is None and not self.failed:
+            self.transport.resumeProducing()
+        self.processBuffer()
+
+    def fail(self, reason):
+        if not self.failed:
+            self.failed = True
+            self.transport.stopProducing()
+            self.finished.errback(reason)
+
+    def finish(self):
+        if self.failed:
+            return
+        self.failed = True      # nothing more to deliver
+        if not self.reason.check(ResponseDone, PotentialDataLoss):
+            self.finished.errback(self.reason)
+        elif not self.isComplete():
+            self.finished.errback(ValueError(
+                "truncated %s: %r" % (self.__class__.__name__,
+                                      self.buffer[:100])))
+        else:
+            self.finished.callback(None)
+
+    def connectionLost(self, reason):
+        self.reason = reason
+        if not self.paused:
+            self.finish()
+
+
+class KeyStreamReceiver(StreamReceiver):
+    """
+    Parser for a keys=stream response, which is a sequence of JSON objects
+    holding a chunk of keys each.
+    """
+    decoder = json.JSONDecoder()
+
+    def nextChunk(self):
+        self.buffer = self.buffer.lstrip()
+        try:
+            chunk, end = self.decoder.raw_decode(self.buffer)
+        except ValueError:
+            return None
+        self.buffer = self.buffer[end:]
+        # Riak decodes the keys from UTF-8 for the JSON response
+        return [key.encode('utf-8') for key in chunk.get(u'keys', [])]
+
+
+def multipart_boundary(content_type):
+    """
+    The boundary parameter of a multipart content type
+    """
+    return re.search('boundary="?([^";]+)', content_type).group(1)
+
+
+class MultipartReceiver(StreamReceiver):
+    """
+    Parser for a multipart/mixed response. Every part is turned into a
+    chunk by partReceived(), which gets the part's headers (lower case
+    names) and its body.
+    """
+    def __init__(self, finished, callback, boundary):
+        StreamReceiver.__init__(self, finished, callback)
+        self.delimiter = '\r\n--' + boundary
+        # the first delimiter may come without the leading CRLF
+        self.buffer = '\r\n'
+        self.started = False
+        self.closed = False
+        self.searchFrom = 0
+
+    def partReceived(self, headers, body):
+        return headers, body
+
+    def nextChunk(self):
+        if self.closed:
+            self.buffer = ''    # ignore the epilogue
+            return None
+
+        idx = self.buffer.find(self.delimiter, self.searchFrom)
+        if idx == -1:
+            # don't search the same data again on the next call
+            self.searchFrom = max(0, len(self.buffer) - len(self.delimiter))
+            return None
+        if len(self.buffer) < idx + len(self.delimiter) + 2:
+            # can't tell the closing delimiter from the others yet
+            self.searchFrom = idx
+            return None
+        part, self.buffer = (self.buffer[:idx],
+                             self.buffer[idx + len(self.delimiter):])
+        self.searchFrom = 0
+
+        if self.buffer.startswith('--'):
+            self.closed = True
+        if not self.started:
+            # the preamble is no part
+            self.started = True
+            return ''
+
+        # skip the rest of the boundary line
+        part = part.split('\r\n', 1)[-1]
+        if part.startswith('\r\n'):
+            head, body = '', part[2:]
+        else:
+            head, body = part.split('\r\n\r\n', 1)
+        headers = {}
+        for line in head.split('\r\n'):
+            if ':' in line:
+                key, value = line.split(':', 1)
+                headers[key.strip().lower()] = value.strip()
+        return self.partReceived(headers, body)
+
+    def isComplete(self):
+        return self.closed
+
+
+class JsonMultipartReceiver(MultipartReceiver):
+    """
+    Parser for a multipart/mixed response holding a JSON object per part,
+    which is decoded by decode.
+    """
+    def __init__(self, finished, callback, boundary, decode=json.loads):
+        MultipartReceiver.__init__(self, finished, callback, boundary)
+        self.decode = decode
+
+    def partReceived(self, headers, body):
+        return self.decode(body)
+
+
+class MapReduceReceiver(JsonMultipartReceiver):
+    """
+    Parser for a chunked MapReduce response, holding the phase and its
+    results per part.
+    """
+    def partReceived(self, headers, body):
+        result = JsonMultipartReceiver.partReceived(self, headers, body)
+        if u'error' in result:
+            raise Exception('Error running MapReduce operation: %s' %
+                            (result[u'error'],))
+        return result[u'phase'], result[u'data']
+
+
+class IndexStreamReceiver(JsonMultipartReceiver):
+    """
+    Parser for a streamed secondary index response, holding a chunk of
+    keys or results per part, and the continuation in the last one.
+    """
+
+
 class StringProducer(object):
     """
     Body producer for t.w.c.Agent
@@ -61,6 +314,49 @@ class StringProducer(object):
         pass
 
 
+class RiakHTTPConnectionPool(HTTPConnectionPool):
+    """
+    Persistent HTTP connection pool shared by all HTTP transports of a
+    RiakClient. Counts how many requests were served by a cached
+    connection (hits) and how many had to open a new one (misses).
+    """
+    def __init__(self, reactor, maxPersistentPerHost=2,
+                 cachedConnectionTimeout=240, retryAutomatically=True):
+        HTTPConnectionPool.__init__(self, reactor, persistent=True)
+        self.maxPersistentPerHost = maxPersistentPerHost
+        self.cachedConnectionTimeout = cachedConnectionTimeout
+        self.retryAutomatically = retryAutomatically
+        self._hits = 0
+        self._misses = 0
+        self._connects = 0
+
+    def getConnection(self, key, endpoint):
+        connects = self._connects
+        d = HTTPConnectionPool.getConnection(self, key, endpoint)
+        if self._connects == connects:
+            self._hits += 1
+        else:
+            self._misses += 1
+        return d
+
+    def _newConnection(self, key, endpoint):
+        self._connects += 1
+        return HTTPConnectionPool._newConnection(self, key, endpoint)
+
+    def stats(self):
+        """
+        Return a dict of pool counters. ``retries`` counts new connections
+        opened to replay a request after a cached connection turned out
+        to be stale.
+        """
+        return {
+            'hits': self._hits,
+            'misses': self._misses,
+            'retries': self._connects - self._misses,
+            'idle': sum(len(c) for c in self._connections.values()),
+        }
+
+
 class XMLSearchResult(object):
     # Match tags that are document fields
     fieldtags = ['str', 'int', 'date']
@@ -118,6 +414,14 @@ class HTTPTransport(transport.FeatureDetection):
     implements(transport.ITransport)
 
     """ HTTP Transport for Riak """
+
+    # persistent connections kept per host:port
+    MAX_PERSISTENT_PER_HOST = 10
+    # how long (in seconds) an idle connection is kept open
+    MAX_IDLETIME = 4 * 60
+    # replay idempotent requests once if a cached connection was stale
+    RETRY_AUTOMATICALLY = True
+
     def __init__(self, client, prefix=None):
         if prefix:
             self._prefix = prefix
@@ -127,16 +431,49 @@ class HTTPTransport(transport.FeatureDetection):
         self.port = client._port
         self.client = client
         self._client_id = None
+        self._nodes = client._nodes
+
+        # all HTTP transports of a client (e.g. RiakSearch) share one pool
+        if client._http_pool is None:
+            client._http_pool = RiakHTTPConnectionPool(reactor,
+                self.MAX_PERSISTENT_PER_HOST, self.MAX_IDLETIME,
+                self.RETRY_AUTOMATICALLY)
+        self._pool = client._http_pool
+        self._agent = Agent(reactor, pool=self._pool)
+
+    def pool_stats(self):
+        """
+        Return connection pool counters (hits, misses, retries, idle)
+        and the state of every node
+        """
+        stats = self._pool.stats()
+        stats['nodes'] = self._nodes.stats()
+        return stats
 
-    def http_response(self, response):
+    def quit(self):
+        """
+        Close all cached connections of the shared pool
+        """
+        return self._pool.closeCachedConnections()
+
+    def http_response(self, response, receiver=None):
         def haveBody(body):
             headers = {"http_code": response.code}
             for key, val in response.headers.getAllRawHeaders():
                 headers[key.lower()] = val[0]
 
-            return headers, body.read()
-
-        if response.length:
+            data = body.read()
+            if self.client.metrics is not None:
+                self.client.metrics.bytes_received(len(data))
+            return headers, data
+
+        if receiver is not None and response.code == 200:
+            # the receiver consumes the body as it streams in
+            receiver = receiver(response)
+            response.deliverBody(receiver)
+            return receiver.finished.addCallback(
+                lambda _: haveBody(StringIO("")))
+        elif response.length:
             d = defer.Deferred()
             response.deliverBody(BodyReceiver(d))
             return d.addCallback(haveBody)
@@ -149,9 +486,8 @@ class HTTPTransport(transport.FeatureDetection):
             t = self.client.request_timeout
             agent.cancel()
 
-    def http_request(self, method, path, headers={}, body=None):
-        url = "http://%s:%s%s" % (self.host, self.port, path)
-
+    def http_request(self, method, path, headers={}, body=None,
+                     receiver=None):
         h = {}
         for k, v in headers.items():
             if not isinstance(v, list):
@@ -163,14 +499,36 @@ class HTTPTransport(transport.FeatureDetection):
         if not 'content-type' in h.keys():
             h['content-type'] = ['application/json']
 
-        if body:
+        return self._node_request(method, path, h, body, receiver, ())
+
+    def _node_request(self, method, path, h, body, receiver, tried):
+        """
+        Send the request to the next node. Requests which could not even
+        connect are retried on the other nodes.
+        """
+        node = self._nodes.select(exclude=tried)
+        url = "http://%s:%s%s" % (node.host, node.port, path)
+
+        if IBodyProducer.providedBy(body):
+            bodyProducer = body
+        elif hasattr(body, 'read'):
+            # stream file-like bodies from disk, chunked if their length
+            # can't be told
+            bodyProducer = FileBodyProducer(body)
+        elif body:
             bodyProducer = StringProducer(body)
         else:
             bodyProducer = None
 
-        requestAgent = Agent(reactor).request(
+        requestAgent = self._agent.request(
                 method, str(url), Headers(h), bodyProducer)
 
+        metrics = self.client.metrics
+        if metrics is not None:
+            started = time.time()
+            if isinstance(body, str):
+                metrics.bytes_sent(len(body))
+
         if self.client.request_timeout:
             # Start request timer
             t = self.client.request_timeout
@@ -180,7 +538,7 @@ class HTTPTransport(transport.FeatureDetection):
             def timeoutProxy(request):
                 if timeout.active():
                     timeout.cancel()
-                return self.http_response(request)
+                return self.http_response(request, receiver)
 
             def requestAborted(failure):
                 failure.trap(defer.CancelledError,
@@ -191,9 +549,67 @@ class HTTPTransport(transport.FeatureDetection):
 
             requestAgent.addCallback(timeoutProxy).addErrback(requestAborted)
         else:
-            requestAgent.addCallback(self.http_response)
-
-        return requestAgent
+            requestAgent.addCallback(self.http_response, receiver)
+
+        def released(result):
+            reason = None
+            if isinstance(result, failure.Failure):
+                reason = result.value
+            self._nodes.release(node, reason)
+            if metrics is not None:
+                operation, bucket = self._operation(method, path)
+                metrics.request(operation, bucket, time.time() - started,
+                                reason is not None and result or None)
+            # a file that can't seek may already be partly read
+            if (isinstance(reason, error.ConnectError) and
+                not hasattr(body, 'read') and
+                len(tried) + 1 < len(self._nodes)):
+                return self._node_request(method, path, h, body, receiver,
+                                          tried + (node,))
+            return result
+
+        return requestAgent.addBoth(released)
+
+    def _operation(self, method, path):
+        """
+        Tell the operation (named like the PBC requests) and the bucket of
+        a request, for metrics
+        """
+        path, _, query = path.partition('?')
+        segments = path.strip('/').split('/')
+        bucket = None
+        if len(segments) > 1 and segments[0] in (self._prefix, 'buckets'):
+            bucket = urllib.unquote_plus(segments[1])
+
+        if segments[0] == self._prefix:
+            if len(segments) == 1:
+                operation = 'list_buckets'
+            elif len(segments) > 3:
+                operation = 'link_walk'
+            elif method in ('PUT', 'POST') and (len(segments) == 3 or
+                                                method == 'POST'):
+                operation = 'put'
+            elif method == 'DELETE':
+                operation = 'del'
+            elif len(segments) == 3:
+                operation = 'get'
+            elif method == 'PUT':
+                operation = 'set_bucket'
+            elif 'keys=true' in query or 'keys=stream' in query:
+                operation = 'list_keys'
+            else:
+                operation = 'get_bucket'
+        elif segments[0] == 'buckets' and 'index' in segments:
+            operation = 'index'
+        elif segments[0] == self.client._mapred_prefix:
+            operation = 'mapred'
+        elif segments[0] == 'stats':
+            operation = 'get_server_info'
+        elif segments[0] == 'solr':
+            operation = 'search_query'
+        else:
+            operation = segments[0] or 'resources'
+        return operation, bucket
 
     def build_rest_path(self, bucket=None, key=None, params=None, prefix=None):
         """
@@ -254,6 +670,23 @@ class HTTPTransport(transport.FeatureDetection):
         keys = [key.encode('utf-8') for key in props[u'keys']]
         defer.returnValue(keys)
 
+    @defer.inlineCallbacks
+    def stream_keys(self, bucket, callback):
+        params = {
+            'props': 'false',
+            'keys': 'stream'
+        }
+        url = self.build_rest_path(bucket, params=params)
+
+        def receiver(response):
+            return KeyStreamReceiver(defer.Deferred(), callback)
+
+        headers, body = yield self.http_request('GET', url,
+                                                receiver=receiver)
+
+        if headers['http_code'] != 200:
+            raise Exception('Error listing keys.')
+
     @defer.inlineCallbacks
     def set_bucket_props(self, bucket, props):
         """
@@ -337,7 +770,7 @@ class HTTPTransport(transport.FeatureDetection):
             defer.returnValue({})
 
     @defer.inlineCallbacks
-    def get(self, robj, r=None, pr=None, vtag=None):
+    def get(self, robj, r=None, pr=None, vtag=None, if_modified=None):
         """
         Get a bucket/key from the server
         """
@@ -348,9 +781,39 @@ class HTTPTransport(transport.FeatureDetection):
         if vtag is not None:
             params['vtag'] = vtag
 
+        # siblings come back in one multipart/mixed response instead of
+        # a list of vtags to fetch one by one
+        headers = {'Accept': 'multipart/mixed, */*;q=0.5'}
+        if if_modified is not None:
+            headers['If-None-Match'] = if_modified[1]
+
         url = self.build_rest_path(robj.get_bucket(), robj.get_key(),
                                    params=params)
-        response = yield self.http_request('GET', url)
+        response = yield self.http_request('GET', url, headers)
+        if response[0]['http_code'] == 304:
+            defer.returnValue(UNCHANGED)
+        defer.returnValue(
+            self.parse_body(response, [200, 300, 404])
+        )
+
+    @defer.inlineCallbacks
+    def stream_get(self, robj, consumer, r=None, pr=None, vtag=None):
+        """
+        Get a bucket/key from the server, writing the value to consumer
+        as it arrives instead of returning it
+        """
+        params = {'r': r, 'pr': pr}
+
+        if vtag is not None:
+            params['vtag'] = vtag
+
+        url = self.build_rest_path(robj.get_bucket(), robj.get_key(),
+                                   params=params)
+
+        def receiver(response):
+            return ConsumerReceiver(defer.Deferred(), consumer)
+
+        response = yield self.http_request('GET', url, receiver=receiver)
         defer.returnValue(
             self.parse_body(response, [200, 300, 404])
         )
@@ -415,7 +878,10 @@ class HTTPTransport(transport.FeatureDetection):
     @defer.inlineCallbacks
     def put_new(self, robj, w=None, dw=None, pw=None, return_body=True,
                 if_none_match=False):
-        """Put a new object into the Riak store, returning its (new) key."""
+        """
+        Put a new object into the Riak store, returning its (new) key and
+        the result put() would return.
+        """
         # We could detect quorum_controls here but HTTP ignores
         # unknown flags/params.
         params = {
@@ -436,11 +902,10 @@ class HTTPTransport(transport.FeatureDetection):
         idx = location.rindex('/')
         key = location[idx + 1:]
         if return_body:
-            vclock, [(metadata, data)] = self.parse_body(response, [201])
-            defer.returnValue((key, vclock, metadata))
+            defer.returnValue((key, self.parse_body(response, [201])))
         else:
             self.check_http_code(response, [201])
-            defer.returnValue((key, None, None))
+            defer.returnValue((key, None))
 
     @defer.inlineCallbacks
     def delete(self, robj, rw=None, r=None, w=None, dw=None, pr=None,
@@ -530,7 +995,7 @@ class HTTPTransport(transport.FeatureDetection):
                             'by this Riak node')
 
         # Construct the job, optionally set the timeout...
-        job = {'inputs': inputs, 'query': query}
+        job = {'inputs': inputs, 'query': query or []}
         if timeout is not None:
             job['timeout'] = timeout
 
@@ -552,16 +1017,52 @@ class HTTPTransport(transport.FeatureDetection):
         result = self.decodeJson(response[1])
         defer.returnValue(result)
 
+    @defer.inlineCallbacks
+    def stream_mapred(self, inputs, query, callback, timeout=None):
+        """
+        Run a MapReduce query, calling callback with (phase, results) for
+        every chunk of results Riak sends.
+        """
+        plm = yield self.phaseless_mapred()
+        if not plm and (query is None or len(query) is 0):
+            raise Exception('Phase-less MapReduce is not supported '
+                            'by this Riak node')
+
+        # Construct the job, optionally set the timeout...
+        job = {'inputs': inputs, 'query': query or []}
+        if timeout is not None:
+            job['timeout'] = timeout
+
+        content = self.encodeJson(job)
+
+        def receiver(response):
+            boundary = multipart_boundary(
+                response.headers.getRawHeaders('content-type')[0])
+            return MapReduceReceiver(defer.Deferred(),
+                                     lambda chunk: callback(*chunk), boundary,
+                                     self.decodeJson)
+
+        # Do the request...
+        url = "/" + self.client._mapred_prefix + "?chunked=true"
+        headers = {'Content-Type': 'application/json'}
+        response = yield self.http_request('POST', url, headers, content,
+                                           receiver=receiver)
+
+        # Make sure the expected status code came back...
+        status = response[0]['http_code']
+        if status != 200:
+            raise Exception(
+                'Error running MapReduce operation. Headers: %s Body: %s' %
+                (repr(response[0]), repr(response[1]))
+            )
+
     @defer.inlineCallbacks
     def get_index(self, bucket, index, startkey, endkey=None):
         """
         Performs a secondary index query.
         """
         # TODO: use resource detection
-        segments = ["buckets", bucket, "index", index, str(startkey)]
-        if endkey:
-            segments.append(str(endkey))
-        uri = '/%s' % ('/'.join(segments))
+        uri = '/%s' % self._index_path(bucket, index, startkey, endkey)
         headers, data = response = yield self.get_request(uri)
         self.check_http_code(response, [200])
         jsonData = self.decodeJson(data)
@@ -571,6 +1072,87 @@ class HTTPTransport(transport.FeatureDetection):
         keys = [key.encode('utf-8') for key in jsonData[u'keys']]
         defer.returnValue(keys)
 
+    @defer.inlineCallbacks
+    def index_page(self, bucket, index, startkey, endkey=None,
+                   return_terms=False, max_results=None, continuation=None):
+        """
+        Performs a query for a page of a secondary index, returns
+        (results, continuation).
+        """
+        yield self._check_paginated_indexes()
+        params = self._index_params(return_terms, max_results, continuation)
+        url = self.build_rest_path(
+            prefix=self._index_path(bucket, index, startkey, endkey),
+            params=params)
+        headers, data = response = yield self.http_request('GET', url)
+        self.check_http_code(response, [200])
+        jsonData = self.decodeJson(data)
+        defer.returnValue((self._index_results(jsonData),
+                           self._index_continuation(jsonData)))
+
+    @defer.inlineCallbacks
+    def stream_index(self, bucket, callback, index, startkey, endkey=None,
+                     return_terms=False, max_results=None, continuation=None):
+        """
+        Performs a secondary index query, calling callback with every
+        chunk of results Riak sends. Returns the continuation.
+        """
+        yield self._check_paginated_indexes()
+        params = self._index_params(return_terms, max_results, continuation)
+        params['stream'] = 'true'
+        url = self.build_rest_path(
+            prefix=self._index_path(bucket, index, startkey, endkey),
+            params=params)
+        last = [None]
+
+        def gotChunk(jsonData):
+            last[0] = self._index_continuation(jsonData) or last[0]
+            results = self._index_results(jsonData)
+            if results:
+                return callback(results)
+
+        def receiver(response):
+            boundary = multipart_boundary(
+                response.headers.getRawHeaders('content-type')[0])
+            return IndexStreamReceiver(defer.Deferred(), gotChunk, boundary,
+                                       self.decodeJson)
+
+        response = yield self.http_request('GET', url, receiver=receiver)
+        self.check_http_code(response, [200])
+        defer.returnValue(last[0])
+
+    def _index_path(self, bucket, index, startkey, endkey=None):
+        segments = ["buckets", bucket, "index", index, str(startkey)]
+        if endkey:
+            segments.append(str(endkey))
+        return '/'.join(segments)
+
+    def _index_params(self, return_terms, max_results, continuation):
+        params = {}
+        if return_terms:
+            params['return_terms'] = 'true'
+        if max_results:
+            params['max_results'] = max_results
+        if continuation:
+            params['continuation'] = continuation
+        return params
+
+    def _index_results(self, jsonData):
+        """
+        The keys of a decoded index response, or its (term, key) pairs if
+        terms were requested. Riak decodes them from UTF-8 for the JSON
+        response.
+        """
+        if u'results' in jsonData:
+            return [(term.encode('utf-8'), key.encode('utf-8'))
+                    for result in jsonData[u'results']
+                    for term, key in result.items()]
+        return [key.encode('utf-8') for key in jsonData.get(u'keys', [])]
+
+    def _index_continuation(self, jsonData):
+        continuation = jsonData.get(u'continuation')
+        return continuation and continuation.encode('utf-8') or None
+
     @defer.inlineCallbacks
     def search(self, index, query, **params):
         """
@@ -638,12 +1220,44 @@ class HTTPTransport(transport.FeatureDetection):
 
         # If 300(Siblings), then return the list of siblings
         elif status == 300:
+            ctype = headers.get('content-type', '')
+            if ctype.startswith('multipart/mixed'):
+                return self.parse_siblings(headers, data)
             # Parse and get rid of 'Siblings:' string in element 0
             siblings = data.strip().split('\n')
             siblings.pop(0)
             return siblings
 
-        # Parse the headers...
+        vclock, metadata = self.parse_metadata(headers)
+        return vclock, [(metadata, data)]
+
+    def parse_siblings(self, headers, data):
+        """
+        Parse a multipart/mixed response holding all the siblings of an
+        object, each part has the headers and the value of one.
+        """
+        boundary = multipart_boundary(headers['content-type'])
+        receiver = MultipartReceiver(None, None, boundary)
+        receiver.buffer += data
+        contents = []
+        while True:
+            part = receiver.nextChunk()
+            if part is None:
+                break
+            if part:
+                part_headers, body = part
+                vclock, metadata = self.parse_metadata(part_headers)
+                contents.append((metadata, body))
+        if not receiver.isComplete():
+            raise exceptions.RiakError('truncated multipart response: %r' %
+                                       (receiver.buffer[:100],))
+        return headers.get('x-riak-vclock'), contents
+
+    def parse_metadata(self, headers):
+        """
+        Return the vclock and the metadata of an object from the headers
+        of a response (lower case names)
+        """
         vclock = None
         metadata = {MD_USERMETA: {}, MD_INDEX: []}
         links = []
@@ -678,7 +1292,7 @@ class HTTPTransport(transport.FeatureDetection):
         if links:
             metadata[MD_LINKS] = links
 
-        return vclock, [(metadata, data)]
+        return vclock, metadata
 
     def to_link_header(self, link):
         """
@@ -758,6 +1372,19 @@ class HTTPTransport(transport.FeatureDetection):
             (headers, body) = data.pop()
             defer.returnValue(body)
 
+    @defer.inlineCallbacks
+    def stream_file(self, key, consumer):
+        """
+        Write the content of a Luwak file to consumer as it arrives
+        """
+        url = self.build_rest_path(prefix='luwak', key=key)
+
+        def receiver(response):
+            return ConsumerReceiver(defer.Deferred(), consumer)
+
+        response = yield self.http_request('GET', url, receiver=receiver)
+        self.check_http_code(response, [200])
+
     @defer.inlineCallbacks
     def delete_file(self, key):
         url = self.build_rest_path(prefix='luwak', key=key)
@@ -0,0 +1,179 @@
+"""
+.. module:: nodes.py
+
+Riak nodes a client talks to and the selection of the node which
+handles the next request.
+
+"""
+
+import time
+
+from twisted.internet import error
+from twisted.python import log
+
+from riakasaurus import exceptions
+
+ROUND_ROBIN = 'round_robin'
+LEAST_OUTSTANDING = 'least_outstanding'
+
+# failures which mean the node (or the way to it) is in trouble, as
+# opposed to errors reported by a healthy node
+NODE_FAILURES = (exceptions.RequestTimeout, exceptions.ConnectTimeout,
+                 error.ConnectionLost, error.ConnectionDone,
+                 error.TimeoutError)
+
+
+class RiakNode(object):
+    """
+    A single Riak node and its health as seen by this client
+    """
+    def __init__(self, host, port):
+        self.host = host
+        self.port = port
+        self.outstanding = 0    # requests currently sent to the node
+        self.requests = 0
+        self.errors = 0
+        self.failures = 0       # consecutive failures
+        self.ejected_until = None
+        self.eject_time = None
+        self.probing = False
+
+    def __repr__(self):
+        return '<RiakNode %s:%s outstanding=%d%s>' % (
+            self.host, self.port, self.outstanding,
+            self.isEjected() and ' ejected' or '')
+
+    def isEjected(self):
+        return self.ejected_until is not None
+
+    def stats(self):
+        return {
+            'host': self.host,
+            'port': self.port,
+            'outstanding': self.outstanding,
+            'requests': self.requests,
+            'errors': self.errors,
+            'ejected': self.isEjected(),
+        }
+
+
+class RiakNodeSet(object):
+    """
+    Picks the node for every request, either round robin or the one with
+    the least outstanding requests. Nodes which fail are ejected for
+    EJECT_TIME seconds, after which a single request probes whether they
+    are back. Every failed probe doubles the ejection, up to
+    MAX_EJECT_TIME.
+    """
+    # consecutive failures (timeouts, lost connections) before a node is
+    # ejected. Refused connections eject a node straight away.
+    MAX_FAILURES = 3
+    EJECT_TIME = 5        # in seconds
+    MAX_EJECT_TIME = 120  # in seconds
+    debug = False
+
+    def __init__(self, nodes, selection=ROUND_ROBIN):
+        if not nodes:
+            raise ValueError("at least one node is required")
+        if selection not in (ROUND_ROBIN, LEAST_OUTSTANDING):
+            raise ValueError("unknown node selection %r" % (selection,))
+        self._nodes = [RiakNode(host, port) for host, port in nodes]
+        self._selection = selection
+        self._next = 0
+
+    def __len__(self):
+        return len(self._nodes)
+
+    def __iter__(self):
+        return iter(self._nodes)
+
+    def select(self, exclude=()):
+        """
+        Return the node which should handle the next request and account
+        for the request on it. Every select() has to be paired with a
+        release().
+        """
+        now = time.time()
+        healthy = []
+        for node in self._nodes:
+            if node in exclude:
+                continue
+            if not node.isEjected():
+                healthy.append(node)
+            elif node.ejected_until <= now and not node.probing:
+                # give the ejected node a chance to prove it is back
+                node.probing = True
+                return self._use(node)
+
+        if not healthy:
+            # everything is down, try the one which comes back first
+            candidates = [n for n in self._nodes if n not in exclude]
+            node = min(candidates or self._nodes,
+                       key=lambda n: n.ejected_until)
+            return self._use(node)
+
+        # rotating the start keeps least outstanding ties round robin
+        start = self._next % len(healthy)
+        self._next += 1
+        if self._selection == ROUND_ROBIN:
+            node = healthy[start]
+        else:
+            node = min(healthy[start:] + healthy[:start],
+                       key=lambda n: n.outstanding)
+        return self._use(node)
+
+    def _use(self, node):
+        node.outstanding += 1
+        node.requests += 1
+        return node
+
+    def abandon(self, node):
+        """
+        Account for a selected request which never reached node, e.g.
+        because the connection pool was exhausted.
+        """
+        if node.outstanding > 0:
+            node.outstanding -= 1
+        node.probing = False
+
+    def release(self, node, reason=None):
+        """
+        Account for a finished request on node. reason is the exception
+        the request failed with, if any.
+        """
+        if node.outstanding > 0:
+            node.outstanding -= 1
+
+        if isinstance(reason, error.ConnectError):
+            node.errors += 1
+            self._eject(node)
+        elif isinstance(reason, NODE_FAILURES):
+            node.errors += 1
+            node.failures += 1
+            if node.probing or node.failures >= self.MAX_FAILURES:
+                self._eject(node)
+        else:
+            node.failures = 0
+            if node.isEjected():
+                if self.debug:
+                    log.msg("[%s] node %s:%s is back" % (
+                        self.__class__.__name__, node.host, node.port))
+                node.ejected_until = None
+                node.eject_time = None
+            node.probing = False
+
+    def _eject(self, node):
+        if node.eject_time is None:
+            node.eject_time = self.EJECT_TIME
+        elif node.probing:
+            node.eject_time = min(node.eject_time * 2, self.MAX_EJECT_TIME)
+        elif node.isEjected():
+            return      # a request sent before the ejection failed
+        node.ejected_until = time.time() + node.eject_time
+        node.probing = False
+        node.failures = 0
+        log.msg("[%s] ejecting node %s:%s for %s seconds" % (
+            self.__class__.__name__, node.host, node.port, node.eject_time))
+
+    def stats(self):
+        return [node.stats() for node in self._nodes]
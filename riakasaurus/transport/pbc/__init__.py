@@ -5,11 +5,15 @@ from twisted.internet import defer, reactor
 from twisted.python.failure import Failure
 
 from struct import pack, unpack
+from collections import deque
+import time
 
 from pprint import pformat
 
-# generated code from *.proto message definitions
-from riakasaurus.transport.pbc import riak_kv_pb2, riak_pb2
+# generated code from *.proto message definitions. riak_kv.proto depends
+# on riak.proto, which the C++ protobuf implementation needs to know first
+from riakasaurus.transport.pbc import riak_pb2, riak_kv_pb2
+from riakasaurus.transport.pbc import decoder
 from riakasaurus import exceptions
 
 ## Protocol codes
@@ -97,6 +101,7 @@ class RiakPBC(Int32StringReceiver):
         MSG_CODE_GET_BUCKET_RESP: RpbGetBucketResp,
         MSG_CODE_GET_SERVER_INFO_RESP: RpbGetServerInfoResp,
         MSG_CODE_INDEX_RESP: RpbIndexResp,
+        MSG_CODE_MAPRED_RESP: RpbMapRedResp,
     }
 
     PBMessageTypes = {
@@ -131,6 +136,15 @@ class RiakPBC(Int32StringReceiver):
         28: 'SEARCH_QUERY_RESP',
     }
 
+    # hand written decoders used instead of the generated messages if
+    # fastDecoding is set
+    fastResponses = {
+        MSG_CODE_GET_RESP: decoder.RpbGetResp,
+        MSG_CODE_PUT_RESP: decoder.RpbPutResp,
+        MSG_CODE_LIST_KEYS_RESP: decoder.RpbListKeysResp,
+        MSG_CODE_INDEX_RESP: decoder.RpbIndexResp,
+    }
+
     nonMessages = (
         MSG_CODE_PING_RESP,
         MSG_CODE_DEL_RESP,
@@ -146,9 +160,20 @@ class RiakPBC(Int32StringReceiver):
     }
 
     timeout = None
-    timeoutd = None
     disconnected = False
     debug = 0
+    # IMetrics provider the requests are reported to, if any
+    metrics = None
+    fastDecoding = False
+
+    def __init__(self):
+        # Riak answers requests on a connection in the order they were
+        # sent, so pending requests are kept in a FIFO of
+        # [deferred, timeout call, stream consumer] entries. This allows
+        # requests to be pipelined on a single connection.
+        self._pending = deque()
+        self._disconnectNotifications = []
+        self.__keyList = []
 
     # ------------------------------------------------------------------
     # Server Operations .. setClientId, getClientId, getServerInfo, ping
@@ -199,6 +224,42 @@ class RiakPBC(Int32StringReceiver):
 
     def get_index(self, bucket, index, startkey, endkey=None):
         code = pack('B', MSG_CODE_INDEX_REQ)
+        req = self._indexRequest(bucket, index, startkey, endkey)
+        d = self.__send(code, req)
+        d.addCallback(lambda resp: resp.keys)
+        return d
+
+    def getIndexPage(self, bucket, index, startkey, endkey=None,
+                     return_terms=False, max_results=None,
+                     continuation=None):
+        """
+        query a secondary index, returning the RpbIndexResp which holds
+        the keys (or the results if return_terms is set) and the
+        continuation of the next page, if there is one
+        """
+        code = pack('B', MSG_CODE_INDEX_REQ)
+        req = self._indexRequest(bucket, index, startkey, endkey,
+                                 return_terms, max_results, continuation)
+        return self.__send(code, req)
+
+    def streamIndex(self, bucket, index, startkey, endkey, callback,
+                    return_terms=False, max_results=None,
+                    continuation=None):
+        """
+        query a secondary index, calling callback with every RpbIndexResp
+        as it arrives. The last one has the field "done" set and holds
+        the continuation if max_results was reached. If callback returns
+        a deferred, the connection is paused until it fires.
+        """
+        code = pack('B', MSG_CODE_INDEX_REQ)
+        req = self._indexRequest(bucket, index, startkey, endkey,
+                                 return_terms, max_results, continuation)
+        req.stream = True
+        return self.__send(code, req, stream=callback)
+
+    def _indexRequest(self, bucket, index, startkey, endkey=None,
+                      return_terms=False, max_results=None,
+                      continuation=None):
         req = RpbIndexReq(bucket=bucket, index=index)
         if endkey:
             req.qtype = RpbIndexReq.range
@@ -207,10 +268,13 @@ class RiakPBC(Int32StringReceiver):
         else:
             req.qtype = RpbIndexReq.eq
             req.key = str(startkey)
-
-        d = self.__send(code, req)
-        d.addCallback(lambda resp: resp.keys)
-        return d
+        if return_terms:
+            req.return_terms = True
+        if max_results:
+            req.max_results = max_results
+        if continuation:
+            req.continuation = continuation
+        return req
 
     def put_new(self, bucket, key, content, vclock=None, **kwargs):
         return put(bucket, key, content, vclock, kwargs)
@@ -219,7 +283,9 @@ class RiakPBC(Int32StringReceiver):
         code = pack('B', MSG_CODE_PUT_REQ)
         request = RpbPutReq()
         request.bucket = bucket
-        request.key = key
+        if key is not None:
+            # Riak generates a key otherwise
+            request.key = key
 
         if isinstance(content, str):
             request.content.value = content
@@ -304,9 +370,29 @@ class RiakPBC(Int32StringReceiver):
         code = pack('B', MSG_CODE_LIST_KEYS_REQ)
         request = RpbListKeysReq()
         request.bucket = bucket
-        self.__keyList = []
         return self.__send(code, request)
 
+    def streamKeys(self, bucket, callback):
+        """
+        list the keys of a bucket, calling callback with every chunk of
+        keys as it arrives instead of collecting them. If callback returns
+        a deferred, the connection is paused until it fires.
+        """
+        code = pack('B', MSG_CODE_LIST_KEYS_REQ)
+        request = RpbListKeysReq()
+        request.bucket = bucket
+        return self.__send(code, request, stream=callback)
+
+    def mapReduce(self, request, content_type, callback):
+        """
+        run a MapReduce job, calling callback with (phase, response) for
+        every result message as it arrives. If callback returns a deferred,
+        the connection is paused until it fires.
+        """
+        code = pack('B', MSG_CODE_MAPRED_REQ)
+        req = RpbMapRedReq(request=request, content_type=content_type)
+        return self.__send(code, req, stream=callback)
+
     def getBuckets(self):
         """
         operates different than the other messages, as it returns more than
@@ -347,11 +433,40 @@ class RiakPBC(Int32StringReceiver):
 
     def connectionLost(self, reason):
         self.disconnected = True
+        notifications, self._disconnectNotifications = \
+            self._disconnectNotifications, []
+        for d in notifications:
+            d.callback(None)
+        # nothing will answer the requests still in flight
+        while self._pending:
+            d, timeoutd, stream = self._pending.popleft()
+            if timeoutd and timeoutd.active():
+                timeoutd.cancel()
+            if not d.called:
+                d.errback(reason)
+
+    def notifyDisconnect(self):
+        """
+        return a deferred which fires once the connection is lost
+        """
+        d = Deferred()
+        if self.disconnected:
+            d.callback(None)
+        else:
+            self._disconnectNotifications.append(d)
+        return d
 
     def setTimeout(self, t):
         self.timeout = t
 
-    def __send(self, code, request=None):
+    def pending(self):
+        """
+        number of requests sent on this connection which have not been
+        answered yet
+        """
+        return len(self._pending)
+
+    def __send(self, code, request=None, stream=None):
         """
         helper method for logging, sending and returning the deferred
         """
@@ -365,18 +480,39 @@ class RiakPBC(Int32StringReceiver):
             msg = code + request.SerializeToString()
         else:
             msg = code
-        self.sendString(msg)
-        self.factory.d = Deferred()
+        d = Deferred()
         if self.timeout:
-            self.timeoutd = reactor.callLater(self.timeout,
-                                              self._triggerTimeout)
+            timeoutd = reactor.callLater(self.timeout,
+                                         self._triggerTimeout, d)
+        else:
+            timeoutd = None
+        self._pending.append([d, timeoutd, stream])
+        self.sendString(msg)
 
-        return self.factory.d
+        if self.metrics is not None:
+            self.metrics.bytes_sent(len(msg) + 4)
+            operation = self.PBMessageTypes[ord(msg[0])][:-4].lower()
+            d.addBoth(self._measure, operation,
+                      getattr(request, 'bucket', None), time.time())
+        return d
 
-    def _triggerTimeout(self):
-        if not self.factory.d.called:
+    def _measure(self, result, operation, bucket, started):
+        reason = None
+        if isinstance(result, Failure):
+            reason = result
+        self.metrics.request(operation, bucket, time.time() - started,
+                             reason)
+        return result
+
+    def _triggerTimeout(self, d):
+        if not d.called:
+            # the response may never come, and the requests pipelined
+            # behind it can't be answered before it is: give up on the
+            # connection. They fail once it is closed.
+            self.disconnected = True
+            self.transport.loseConnection()
             try:
-                self.factory.d.errback(exceptions.RequestTimeout('timeout'))
+                d.errback(exceptions.RequestTimeout('timeout'))
             except Exception, e:
                 print "Unable to handle Timeout: %s" % e
 
@@ -388,22 +524,35 @@ class RiakPBC(Int32StringReceiver):
         messages that dont have a body to parse return True, those are
         listed in self.nonMessages
         """
-        if self.timeoutd and self.timeoutd.active():
-            self.timeoutd.cancel()  # stop timeout from beeing raised
-
-        def returnOrRaiseException(msg):
-            exc = exceptions.RiakPBCException(msg)
-            if self.factory.d.called:
-                raise exc
-            else:
-                self.factory.d.errback(Failure(exc))
-
         # decode messagetype
         code = unpack('B', data[:1])[0]
+        if self.metrics is not None:
+            self.metrics.bytes_received(len(data) + 4)
         if self.debug:
             print "[%s] stringReceived code %s" % (self.__class__.__name__,
                 self.PBMessageTypes[code])
 
+        if not self._pending:
+            raise exceptions.RiakPBCException(
+                'unexpected message: %s' % self.PBMessageTypes.get(code, code))
+
+        entry = self._pending[0]
+        d, timeoutd, stream = entry
+
+        def finish():
+            # the request has been answered completely, dequeue it
+            self._pending.popleft()
+            if timeoutd and timeoutd.active():
+                timeoutd.cancel()  # stop timeout from beeing raised
+
+        def returnOrRaiseException(msg):
+            finish()
+            exc = exceptions.RiakPBCException(msg)
+            if d.called:
+                raise exc
+            else:
+                d.errback(Failure(exc))
+
         if code not in self.riakResponses and code not in self.nonMessages:
             returnOrRaiseException('unknown messagetype: %d' % code)
 
@@ -412,8 +561,9 @@ class RiakPBC(Int32StringReceiver):
             if self.debug:
                 print "[%s] stringReceived empty message type %s" % (
                     self.__class__.__name__, self.PBMessageTypes[code])
-            if not self.factory.d.called:
-                self.factory.d.callback(True)
+            finish()
+            if not d.called:
+                d.callback(True)
             return
 
         elif code == MSG_CODE_LIST_KEYS_RESP:
@@ -422,7 +572,51 @@ class RiakPBC(Int32StringReceiver):
             # the last message contains a optional field "done"
             # so collect all the messages until the last one, then call the
             # callback
-            response = RpbListKeysResp()
+            response = self._parse(code, data)
+            if self.debug:
+                print "[%s] %s %s" % (
+                        self.__class__.__name__,
+                        response.__class__.__name__,
+                        str(response).replace('\n', ' ')
+                    )
+
+            result = None
+            if stream is None:
+                self.__keyList.extend([x for x in response.keys])
+            elif len(response.keys):
+                result = self._streamChunk(entry, list(response.keys))
+
+            if response.HasField('done') and response.done:
+                keyList, self.__keyList = self.__keyList, []
+                finish()
+                if stream is None:
+                    if not d.called:
+                        d.callback(keyList)
+                else:
+                    self._streamDone(entry, result)
+
+        elif code == MSG_CODE_INDEX_RESP and stream is not None:
+            # a streamed index query answers with a message per chunk of
+            # keys, the last one has the field "done" set. It may carry
+            # nothing but the continuation, so every message is handed on
+            response = self._parse(code, data)
+            if self.debug:
+                print "[%s] %s %s" % (
+                        self.__class__.__name__,
+                        response.__class__.__name__,
+                        str(response).replace('\n', ' ')
+                    )
+
+            result = self._streamChunk(entry, response)
+
+            if response.HasField('done') and response.done:
+                finish()
+                self._streamDone(entry, result)
+
+        elif code == MSG_CODE_MAPRED_RESP:
+            # like listKeys, MapReduce answers with a message per result
+            # chunk, the last one has the field "done" set
+            response = RpbMapRedResp()
             response.ParseFromString(data[1:])
             if self.debug:
                 print "[%s] %s %s" % (
@@ -431,19 +625,21 @@ class RiakPBC(Int32StringReceiver):
                         str(response).replace('\n', ' ')
                     )
 
-            self.__keyList.extend([x for x in response.keys])
+            result = None
+            if response.HasField('response'):
+                result = self._streamChunk(
+                    entry, (response.phase, response.response))
+
             if response.HasField('done') and response.done:
-                if not self.factory.d.called:
-                    self.factory.d.callback(self.__keyList)
-                    self.__keyList = []
+                finish()
+                self._streamDone(entry, result)
 
         else:
             # normal handling, pick the message code, call ParseFromString()
             # on it, and return the message
-            response = self.riakResponses[code]()
             if len(data) > 1:
                 # if there's data, parse it, otherwise return empty object
-                response.ParseFromString(data[1:])
+                response = self._parse(code, data)
                 if self.debug:
                     print "[%s] %s %s" % (
                         self.__class__.__name__,
@@ -452,12 +648,76 @@ class RiakPBC(Int32StringReceiver):
                     )
 
                 if code == MSG_CODE_ERROR_RESP:
+                    self.__keyList = []
                     returnOrRaiseException('%s (%d)' % (
                         response.errmsg, response.errcode)
                     )
+                    return
+            else:
+                response = self.riakResponses[code]()
+
+            finish()
+            if not d.called:
+                d.callback(response)
 
-            if not self.factory.d.called:
-                self.factory.d.callback(response)
+    def _parse(self, code, data):
+        """
+        decode the response message in data, which starts with its code
+        """
+        if self.fastDecoding and code in self.fastResponses:
+            try:
+                return decoder.decode(self.fastResponses[code], data, 1)
+            except Exception:
+                # let the generated code deal with (or report) whatever
+                # the fast decoder did not understand
+                pass
+        response = self.riakResponses[code]()
+        response.ParseFromString(data[1:])
+        return response
+
+    def _streamChunk(self, entry, chunk):
+        """
+        hand a chunk of a streaming response to the consumer of the
+        request. While a deferred returned by the consumer has not fired
+        yet, reading from the connection is paused.
+        """
+        try:
+            result = entry[2](chunk)
+        except Exception:
+            self._streamFailed(entry, Failure())
+            return None
+
+        if isinstance(result, Deferred):
+            result.addErrback(lambda f: self._streamFailed(entry, f))
+            if not result.called:
+                self.pauseProducing()
+                result.addBoth(self._resumeStream)
+        return result
+
+    def _resumeStream(self, result):
+        if not self.disconnected:
+            self.resumeProducing()
+        return result
+
+    def _streamFailed(self, entry, reason):
+        # the rest of the stream still has to be read off the connection
+        entry[2] = lambda chunk: None
+        if not entry[0].called:
+            entry[0].errback(reason)
+
+    def _streamDone(self, entry, result):
+        """
+        fire the deferred of a streaming request once the consumer has
+        dealt with the last chunk
+        """
+        def done(_):
+            if not entry[0].called:
+                entry[0].callback(None)
+
+        if isinstance(result, Deferred):
+            result.addBoth(done)
+        else:
+            done(None)
 
     def _resolveNums(self, val):
         if isinstance(val, str):
@@ -482,7 +742,6 @@ class RiakPBCClientFactory(ClientFactory):
     noisy = False
 
     def __init__(self):
-        self.d = Deferred()
         self.connected = Deferred()
 
     def clientConnectionFailed(self, connector, reason):
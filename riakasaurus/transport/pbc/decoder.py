@@ -0,0 +1,215 @@
+"""
+.. module:: decoder.py
+
+Hand written decoders for the responses a client receives most (gets,
+puts, key listings and index queries). They read the wire format straight
+into plain objects which have the attributes and HasField() of the
+generated messages but skip the reflection of the pure Python protobuf
+implementation, which makes decoding several times faster.
+
+"""
+
+# wire types
+VARINT = 0
+FIXED64 = 1
+LENGTH_DELIMITED = 2
+FIXED32 = 5
+
+# field kinds
+BYTES = 0
+BOOL = 1
+UINT = 2
+
+
+class DecodeError(Exception):
+    pass
+
+
+class Message(object):
+    """
+    Fields which were not on the wire fall back to the defaults in the
+    class, like they do on generated messages.
+    """
+    # field number: (name, kind or Message subclass, repeated)
+    FIELDS = {}
+
+    def HasField(self, name):
+        return name in self.__dict__
+
+    def __repr__(self):
+        return '<%s %s>' % (self.__class__.__name__, ' '.join(
+            '%s=%r' % item for item in sorted(self.__dict__.items())))
+
+    __str__ = __repr__
+
+
+def _varint(data, pos):
+    b = ord(data[pos])
+    pos += 1
+    if b < 0x80:
+        return b, pos
+    result = b & 0x7f
+    shift = 7
+    while True:
+        b = ord(data[pos])
+        pos += 1
+        result |= (b & 0x7f) << shift
+        if b < 0x80:
+            return result, pos
+        shift += 7
+        if shift > 63:
+            raise DecodeError('varint too long')
+
+
+def decode(cls, data, pos=0, end=None):
+    """
+    decode the message of type cls in data[pos:end]
+    """
+    if end is None:
+        end = len(data)
+    msg = cls.__new__(cls)
+    values = msg.__dict__
+    fields = cls.FIELDS
+    for name, kind, repeated in cls.REPEATED:
+        values[name] = []
+
+    while pos < end:
+        tag = ord(data[pos])
+        if tag < 0x80:
+            pos += 1
+        else:
+            tag, pos = _varint(data, pos)
+        wiretype = tag & 7
+        field = fields.get(tag >> 3)
+
+        if wiretype == LENGTH_DELIMITED:
+            length, pos = _varint(data, pos)
+            start, pos = pos, pos + length
+            if pos > end:
+                raise DecodeError('truncated message')
+            if field is None:
+                continue
+            name, kind, repeated = field
+            if kind is BYTES:
+                value = data[start:pos]
+            else:
+                value = decode(kind, data, start, pos)
+        elif wiretype == VARINT:
+            value, pos = _varint(data, pos)
+            if field is None:
+                continue
+            name, kind, repeated = field
+            if kind is BOOL:
+                value = bool(value)
+        elif wiretype == FIXED64:
+            pos += 8
+            continue
+        elif wiretype == FIXED32:
+            pos += 4
+            continue
+        else:
+            raise DecodeError('unsupported wire type %d' % wiretype)
+
+        if repeated:
+            values[name].append(value)
+        else:
+            values[name] = value
+
+    if pos != end:
+        raise DecodeError('truncated message')
+    return msg
+
+
+def _fields(cls):
+    cls.REPEATED = [field for field in cls.FIELDS.values() if field[2]]
+    return cls
+
+
+@_fields
+class RpbPair(Message):
+    FIELDS = {
+        1: ('key', BYTES, False),
+        2: ('value', BYTES, False),
+    }
+    key = ''
+    value = ''
+
+
+@_fields
+class RpbLink(Message):
+    FIELDS = {
+        1: ('bucket', BYTES, False),
+        2: ('key', BYTES, False),
+        3: ('tag', BYTES, False),
+    }
+    bucket = ''
+    key = ''
+    tag = ''
+
+
+@_fields
+class RpbContent(Message):
+    FIELDS = {
+        1: ('value', BYTES, False),
+        2: ('content_type', BYTES, False),
+        3: ('charset', BYTES, False),
+        4: ('content_encoding', BYTES, False),
+        5: ('vtag', BYTES, False),
+        6: ('links', RpbLink, True),
+        7: ('last_mod', UINT, False),
+        8: ('last_mod_usecs', UINT, False),
+        9: ('usermeta', RpbPair, True),
+        10: ('indexes', RpbPair, True),
+        11: ('deleted', BOOL, False),
+    }
+    value = ''
+    content_type = ''
+    charset = ''
+    content_encoding = ''
+    vtag = ''
+    last_mod = 0
+    last_mod_usecs = 0
+    deleted = False
+
+
+@_fields
+class RpbGetResp(Message):
+    FIELDS = {
+        1: ('content', RpbContent, True),
+        2: ('vclock', BYTES, False),
+        3: ('unchanged', BOOL, False),
+    }
+    vclock = ''
+    unchanged = False
+
+
+@_fields
+class RpbPutResp(Message):
+    FIELDS = {
+        1: ('content', RpbContent, True),
+        2: ('vclock', BYTES, False),
+        3: ('key', BYTES, False),
+    }
+    vclock = ''
+    key = ''
+
+
+@_fields
+class RpbListKeysResp(Message):
+    FIELDS = {
+        1: ('keys', BYTES, True),
+        2: ('done', BOOL, False),
+    }
+    done = False
+
+
+@_fields
+class RpbIndexResp(Message):
+    FIELDS = {
+        1: ('keys', BYTES, True),
+        2: ('results', RpbPair, True),
+        3: ('continuation', BYTES, False),
+        4: ('done', BOOL, False),
+    }
+    continuation = ''
+    done = False
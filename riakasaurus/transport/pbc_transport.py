@@ -3,13 +3,18 @@ from zope.interface import implements
 from twisted.protocols.basic import LineReceiver
 LineReceiver.MAX_LENGTH = 1024 * 1024 * 64
 
-from twisted.internet import defer, reactor, protocol
-from twisted.python import log
+from twisted.internet import defer, reactor, protocol, error
+from twisted.internet.interfaces import IConsumer
+from twisted.web.client import FileBodyProducer
+from twisted.web.iweb import IBodyProducer
+from twisted.python import log, failure
+from google.protobuf.internal import api_implementation
 import logging
 
-from distutils.version import LooseVersion
 
 import time
+from collections import deque
+from cStringIO import StringIO
 
 # MD_ resources
 from riakasaurus.metadata import *
@@ -17,6 +22,7 @@ from riakasaurus.metadata import *
 from riakasaurus.riak_index_entry import RiakIndexEntry
 from riakasaurus.mapreduce import RiakLink
 from riakasaurus import exceptions
+from riakasaurus.cache import UNCHANGED
 
 # protobuf
 from riakasaurus.transport import transport, pbc
@@ -26,39 +32,91 @@ LOGLEVEL_TRANSPORT = 2
 LOGLEVEL_TRANSPORT_VERBOSE = 4
 
 
-class StatefulTransport(object):
+class StringConsumer(object):
+    """ Collects what a producer writes into a string """
+    implements(IConsumer)
+
     def __init__(self):
+        self.buffer = StringIO()
+
+    def registerProducer(self, producer, streaming):
+        pass
+
+    def unregisterProducer(self):
+        pass
+
+    def write(self, data):
+        self.buffer.write(data)
+
+    def value(self):
+        return self.buffer.getvalue()
+
+
+class StatefulTransport(object):
+    def __init__(self, onRelease=None):
         self.__transport = None
-        self.__state = 'idle'
+        self.__onRelease = onRelease  # called when a request is done
+        self.__inflight = 0     # requests currently using the transport
+        self.__waiting = []     # deferreds waiting for the connection
         self.__created = time.time()
         self.__used = time.time()
 
     def __repr__(self):
-        return '<StatefulTransport idle=%.2fs state=\'%s\' transport=%s>' % (
-            time.time() - self.__used, self.__state, self.__transport)
+        return '<StatefulTransport idle=%.2fs state=\'%s\' inflight=%d ' \
+               'transport=%s>' % (
+            time.time() - self.__used,
+            self.isActive() and 'active' or 'idle',
+            self.__inflight, self.__transport)
 
     def __enter__(self):
         return self.getTransport()
 
     def __exit__(self, exc_type, exc_value, traceback):
         self.setIdle()
+        if self.__onRelease is not None:
+            self.__onRelease(self, exc_value)
 
     def isActive(self):
-        return self.__state == 'active'
+        return self.__inflight > 0
 
     def setActive(self):
-        self.__state = 'active'
+        """ account for one more request using the transport """
+        self.__inflight += 1
         self.__used = time.time()
 
     def isIdle(self):
-        return self.__state == 'idle'
+        return self.__inflight == 0
 
     def setIdle(self):
-        self.__state = 'idle'
+        """ account for a request which is done with the transport """
+        if self.__inflight > 0:
+            self.__inflight -= 1
         self.__used = time.time()
 
+    def inflight(self):
+        return self.__inflight
+
     def setTransport(self, transport):
         self.__transport = transport
+        waiting, self.__waiting = self.__waiting, []
+        for d in waiting:
+            d.callback(transport)
+
+    def notifyConnected(self):
+        """
+        return a deferred which fires with the transport once the
+        connection of this placeholder is established
+        """
+        if self.__transport is not None:
+            return defer.succeed(self.__transport)
+        d = defer.Deferred()
+        self.__waiting.append(d)
+        return d
+
+    def connectionFailed(self, reason):
+        waiting, self.__waiting = self.__waiting, []
+        for d in waiting:
+            d.errback(reason)
 
     def getTransport(self):
         return self.__transport
@@ -71,6 +129,277 @@ class StatefulTransport(object):
         return transport and transport.isDisconnected()
 
 
+class PBCPool(object):
+    """
+    Connections to a single Riak node. Busy connections are shared for
+    pipelining and, once those are exhausted as well, requests queue up
+    for the next connection which is released. Limits are read from the
+    owning PBCTransport.
+    """
+
+    def __init__(self, owner, node):
+        self.owner = owner
+        self.node = node
+        # idle transports, least recently used first
+        self._idle = deque()
+        # transports with requests in flight, including connecting ones
+        self._active = set()
+        # busy transports which can take another pipelined request
+        self._shared = deque()
+        self._sharedSet = set()
+        self._waiters = deque()  # (deferred, timeout call, enqueue time)
+        self._stats = {
+            'waits': 0,          # acquisitions which had to queue
+            'wait_time': 0.0,    # seconds spent queueing, in total
+            'max_wait_time': 0.0,
+            'max_waiting': 0,    # high water mark of the queue
+            'timeouts': 0,       # waiters expired by ACQUIRE_TIMEOUT
+            'rejected': 0,       # acquisitions refused, queue full
+        }
+
+    def __repr__(self):
+        return '<PBCPool %s:%s idle=%d active=%d waiting=%d>' % (
+            self.node.host, self.node.port, len(self._idle),
+            len(self._active), len(self._waiters))
+
+    def _log(self, level, msg):
+        if self.owner.debug & level:
+            log.msg("[%s] %s" % (self.owner.__class__.__name__, msg),
+                    logLevel=self.owner.logToLevel)
+
+    def stats(self):
+        stats = dict(self._stats)
+        stats['transports'] = len(self._idle) + len(self._active)
+        stats['active'] = len(self._active)
+        stats['idle'] = len(self._idle)
+        stats['waiting'] = len(self._waiters)
+        return stats
+
+    @defer.inlineCallbacks
+    def acquire(self):
+        if self._idle:
+            # most recently used first, so surplus transports can expire
+            stp = self._idle.pop()
+            self._activate(stp)
+            self._log(LOGLEVEL_TRANSPORT_VERBOSE,
+                      "aquired idle transport[%d]: %s" % (
+                          len(self._active), stp))
+            defer.returnValue(stp)
+
+        if len(self._active) >= self.owner.MAX_TRANSPORTS:
+            stp = self._getPipelineTransport()
+            if stp is None:
+                # every transport is busy, queue up for the next one
+                stp = yield self._waitForTransport()
+                defer.returnValue(stp)
+
+            try:
+                transport = yield stp.notifyConnected()
+            except Exception:
+                stp.setIdle()
+                raise
+            transport.setTimeout(self.owner.timeout)
+            self._log(LOGLEVEL_TRANSPORT_VERBOSE,
+                      "pipelining on transport[%d]: %s" % (
+                          len(self._active), stp))
+            defer.returnValue(stp)
+
+        # nothin free, create a new protocol instance, add it to
+        # self._active and return it
+
+        # insert a placeholder into self._active to avoid race
+        # conditions with the MAX_TRANSPORTS check above.
+        stp = StatefulTransport(self._releaseTransport)
+        stp.setActive()
+        idx = len(self._active)
+        self._active.add(stp)
+        self._share(stp)
+
+        # create the transport and use it to configure the placeholder.
+        try:
+            transport = yield pbc.RiakPBCClient().connect(self.node.host,
+                                                          self.node.port)
+        except Exception:
+            self._active.discard(stp)
+            stp.connectionFailed(failure.Failure())
+            # the slot is free again, let a waiter try its luck
+            self._wakeWaiter()
+            raise
+
+        stp.setTransport(transport)
+        transport.metrics = self.owner.client.metrics
+        transport.fastDecoding = self.owner.FAST_DECODING
+        transport.notifyDisconnect().addCallback(
+            lambda _: self._transportLost(stp))
+        if self.owner.timeout:
+            transport.setTimeout(self.owner.timeout)
+        self._log(LOGLEVEL_TRANSPORT,
+                  "allocate new transport[%d]: %s" % (idx, stp))
+        defer.returnValue(stp)
+
+    def _activate(self, stp):
+        """
+        account for a new request on stp and make sure it is tracked as
+        active
+        """
+        stp.setActive()
+        stp.getTransport().setTimeout(self.owner.timeout)
+        self._active.add(stp)
+        self._share(stp)
+
+    def _share(self, stp):
+        """
+        offer a busy transport for pipelining if it has room left
+        """
+        if (stp.inflight() < self.owner.PIPELINE_DEPTH and
+            stp not in self._sharedSet):
+            self._sharedSet.add(stp)
+            self._shared.append(stp)
+
+    def _getPipelineTransport(self):
+        """
+        return the next busy transport which can take another pipelined
+        request, otherwise None
+        """
+        while self._shared:
+            stp = self._shared.popleft()
+            self._sharedSet.discard(stp)
+            if (stp in self._active and
+                stp.inflight() < self.owner.PIPELINE_DEPTH):
+                stp.setActive()
+                # back of the line, this spreads requests round robin
+                self._share(stp)
+                return stp
+        return None
+
+    def _waitForTransport(self):
+        """
+        return a deferred which fires with a transport as soon as one is
+        released, or fails if the queue is full or ACQUIRE_TIMEOUT passes
+        """
+        if len(self._waiters) >= self.owner.MAX_WAITERS:
+            self._stats['rejected'] += 1
+            return defer.fail(
+                exceptions.PoolExhausted("too many transports, aborting"))
+
+        d = defer.Deferred()
+        entry = [d, None, time.time()]
+        if self.owner.ACQUIRE_TIMEOUT is not None:
+            entry[1] = reactor.callLater(self.owner.ACQUIRE_TIMEOUT,
+                                         self._expireWaiter, entry)
+        self._waiters.append(entry)
+        self._stats['waits'] += 1
+        self._stats['max_waiting'] = max(self._stats['max_waiting'],
+                                         len(self._waiters))
+        self._log(LOGLEVEL_TRANSPORT_VERBOSE,
+                  "waiting for a transport, %d waiters" % len(self._waiters))
+        return d
+
+    def _expireWaiter(self, entry):
+        self._waiters.remove(entry)
+        self._stats['timeouts'] += 1
+        self._accountWait(entry, timed_out=True)
+        entry[0].errback(exceptions.RequestTimeout(
+            "no transport became available within %s seconds" %
+            self.owner.ACQUIRE_TIMEOUT))
+
+    def _accountWait(self, entry, timed_out=False):
+        waited = time.time() - entry[2]
+        self._stats['wait_time'] += waited
+        self._stats['max_wait_time'] = max(self._stats['max_wait_time'],
+                                           waited)
+        if self.owner.client.metrics is not None:
+            self.owner.client.metrics.acquire_wait(waited, timed_out)
+
+    def _popWaiter(self):
+        d, timeoutd, enqueued = entry = self._waiters.popleft()
+        if timeoutd is not None and timeoutd.active():
+            timeoutd.cancel()
+        self._accountWait(entry)
+        return d
+
+    def _releaseTransport(self, stp, reason=None):
+        """
+        called whenever a request is done with a transport. Hands the
+        transport over to the longest waiting request or returns it to
+        the idle transports.
+        """
+        self.owner._nodes.release(self.node, reason)
+        if stp not in self._active:
+            return      # lost or expired in the meantime
+        if stp.isDisconnected():
+            # closing, after a request on it timed out
+            self._active.discard(stp)
+            self._log(LOGLEVEL_TRANSPORT, "drop transport %s" % stp)
+            self._wakeWaiter()
+        elif self._waiters:
+            self._activate(stp)
+            self._popWaiter().callback(stp)
+        elif stp.isIdle():
+            self._active.discard(stp)
+            self._idle.append(stp)
+        else:
+            self._share(stp)
+
+    def _transportLost(self, stp):
+        """
+        called when the connection of a transport went away
+        """
+        if stp in self._active:
+            self._active.discard(stp)
+        else:
+            try:
+                self._idle.remove(stp)
+            except ValueError:
+                return      # already expired by us
+        self._log(LOGLEVEL_TRANSPORT, "lost transport %s" % stp)
+        # the slot is free again
+        self._wakeWaiter()
+
+    def _wakeWaiter(self):
+        """
+        let the longest waiting request acquire a transport on its own,
+        used when a slot in the pool was freed up
+        """
+        if self._waiters:
+            self.acquire().chainDeferred(self._popWaiter())
+
+    @defer.inlineCallbacks
+    def garbageCollect(self):
+        # idle transports are ordered by the time they were released,
+        # so only the expired ones at the front need to be looked at
+        while (self._idle and
+               self._idle[0].age() > self.owner.MAX_IDLETIME):
+            stp = self._idle.popleft()
+            self._log(LOGLEVEL_TRANSPORT, "expire idle transport %s" % stp)
+            yield stp.getTransport().quit()
+
+        if not self.owner.timeout:
+            return
+
+        for stp in list(self._active):
+            if (stp.getTransport() is None or
+                stp.age() <= self.owner.timeout):
+                continue
+            self._active.discard(stp)
+            self._log(LOGLEVEL_TRANSPORT,
+                      "expire timeouted transport %s" % stp)
+            yield stp.getTransport().quit()
+            self._wakeWaiter()
+
+    @defer.inlineCallbacks
+    def quit(self):
+        while self._waiters:
+            self._popWaiter().errback(
+                exceptions.PoolExhausted("transport is shutting down"))
+
+        transports = list(self._idle) + list(self._active)
+        for stp in transports:
+            self._log(LOGLEVEL_DEBUG, "transport[%d].quit() %s" % (
+                len(transports), stp))
+            yield (stp.getTransport() and stp.getTransport().quit())
+
+
 class PBCTransport(transport.FeatureDetection):
     """ Protocoll buffer transport for Riak """
 
@@ -78,8 +407,22 @@ class PBCTransport(transport.FeatureDetection):
 
     debug = 0
     logToLevel = logging.INFO
+    # connections per Riak node
     MAX_TRANSPORTS = 50
+    # requests which may be in flight on one connection. Once all
+    # MAX_TRANSPORTS connections are busy, further requests are pipelined
+    # round robin onto the busy connections. 1 disables pipelining.
+    PIPELINE_DEPTH = 1
+    # requests which may queue up per node waiting for a free transport
+    # once the pool is exhausted, and how long (in seconds) each of them
+    # may wait. None waits as long as it takes.
+    MAX_WAITERS = 1000
+    ACQUIRE_TIMEOUT = None
     MAX_IDLETIME = 5 * 60     # in seconds
+    # decode the hottest responses with the hand written decoders of
+    # pbc.decoder instead of the generated protobuf code, unless protobuf's
+    # C++ implementation, which is faster still, is in use
+    FAST_DECODING = api_implementation.Type() != 'cpp'
     # how often (in seconds) the garbage collection should run
     # XXX Why the hell do we even have to override GC?
     GC_TIME = 120
@@ -90,110 +433,66 @@ class PBCTransport(transport.FeatureDetection):
         self.port = client._port
         self.client = client
         self._client_id = None
-        self._transports = []    # list of transports, empty on start
+        self._nodes = client._nodes
+        self._pools = dict((node, PBCPool(self, node))
+                           for node in self._nodes)
         self._gc = reactor.callLater(self.GC_TIME, self._garbageCollect)
         self.timeout = client.request_timeout
 
     def setTimeout(self, t):
         self.timeout = t
 
+    def pool_stats(self):
+        """
+        Return connection pool counters summed up over all nodes: number
+        of transports, how many are busy, current queue depth and wait
+        statistics, as well as the state of every node.
+        """
+        stats = {}
+        for pool in self._pools.values():
+            for key, value in pool.stats().items():
+                if key.startswith('max_'):
+                    stats[key] = max(stats.get(key, 0), value)
+                else:
+                    stats[key] = stats.get(key, 0) + value
+        stats['nodes'] = self._nodes.stats()
+        return stats
+
     @defer.inlineCallbacks
     def _getFreeTransport(self):
-        foundOne = False
-
-        # Discard disconnected transports.
-        self._transports = [x for x in self._transports if not x.isDisconnected()]
-
-        for stp in self._transports:
-            if stp.isIdle():
-                stp.setActive()
-                stp.getTransport().setTimeout(self.timeout)
-                foundOne = True
-                if self.debug & LOGLEVEL_TRANSPORT_VERBOSE:
-                    log.msg("[%s] aquired idle transport[%d]: %s" % (
-                            self.__class__.__name__,
-                            len(self._transports), stp
-                        ), logLevel=self.logToLevel)
-                defer.returnValue(stp)
-        if not foundOne:
-            if len(self._transports) >= self.MAX_TRANSPORTS:
-                raise Exception("too many transports, aborting")
-
-            # nothin free, create a new protocol instance, append
-            # it to self._transports and return it
-
-            # insert a placeholder into self._transports to avoid race
-            # conditions with the MAX_TRANSPORTS check above.
-            stp = StatefulTransport()
-            stp.setActive()
-            idx = len(self._transports)
-            self._transports.append(stp)
-
-            # create the transport and use it to configure the placeholder.
+        """
+        acquire a transport from the pool of the next node. Nodes which
+        refuse the connection are skipped.
+        """
+        tried = ()
+        while True:
+            node = self._nodes.select(exclude=tried)
             try:
-                transport = yield pbc.RiakPBCClient().connect(self.host, self.port)
-                stp.setTransport(transport)
-                if self.timeout:
-                    transport.setTimeout(self.timeout)
-                if self.debug & LOGLEVEL_TRANSPORT:
-                    log.msg("[%s] allocate new transport[%d]: %s" % (
-                            self.__class__.__name__, idx, stp
-                        ), logLevel=self.logToLevel)
-                defer.returnValue(stp)
+                stp = yield self._pools[node].acquire()
+            except error.ConnectError, e:
+                self._nodes.release(node, e)
+                tried += (node,)
+                if len(tried) < len(self._nodes):
+                    continue
+                raise
             except Exception:
-                self._transports.remove(stp)
+                self._nodes.abandon(node)
                 raise
-
+            defer.returnValue(stp)
 
     @defer.inlineCallbacks
     def _garbageCollect(self):
         self._gc = reactor.callLater(self.GC_TIME, self._garbageCollect)
-        for idx, stp in enumerate(self._transports):
-            if (stp.isIdle() and stp.age() > self.MAX_IDLETIME):
-                yield stp.getTransport().quit()
-                if self.debug & LOGLEVEL_TRANSPORT:
-                    log.msg("[%s] expire idle transport[%d] %s" % (
-                            self.__class__.__name__,
-                            idx,
-                            stp
-                        ), logLevel=self.logToLevel)
-
-                    log.msg("[%s] %s" % (
-                            self.__class__.__name__,
-                            self._transports
-                        ), logLevel=self.logToLevel)
-
-                self._transports.remove(stp)
-            elif self.timeout and stp.isActive() and stp.age() > self.timeout:
-                yield stp.getTransport().quit()
-                if self.debug & LOGLEVEL_TRANSPORT:
-                    log.msg("[%s] expire timeouted transport[%d] %s" % (
-                            self.__class__.__name__,
-                            idx,
-                            stp
-                        ), logLevel=self.logToLevel)
-
-                    log.msg("[%s] %s" % (
-                            self.__class__.__name__,
-                            self._transports
-                        ), logLevel=self.logToLevel)
-
-                self._transports.remove(stp)
+        for pool in self._pools.values():
+            yield pool.garbageCollect()
 
     @defer.inlineCallbacks
     def quit(self):
         if not self._gc.cancelled:
             self._gc.cancel()      # cancel the garbage collector
 
-        for stp in self._transports:
-            if self.debug & LOGLEVEL_DEBUG:
-                log.msg("[%s] transport[%d].quit() %s" % (
-                        self.__class__.__name__,
-                        len(self._transports),
-                        stp
-                    ), logLevel=self.logToLevel)
-
-            yield (stp.getTransport() and stp.getTransport().quit())
+        for pool in self._pools.values():
+            yield pool.quit()
 
     def __del__(self):
         """on shutdown, close all transports"""
@@ -206,18 +505,25 @@ class PBCTransport(transport.FeatureDetection):
                          return_body=return_body, if_none_match=if_none_match)
 
         if return_body:
-            return ret
+            return ret.addCallback(self.parseRpbGetResp)
         else:
-            return None
+            # still wait for the write, but there is nothing to parse
+            return ret.addCallback(lambda _: None)
 
     def put_new(self, robj, w=None, dw=None, pw=None, return_body=True,
                 if_none_match=False):
+        """
+        store an object without a key, returns (key, result) with the key
+        Riak generated and the result put() would return
+        """
+        def stored(resp):
+            if not return_body:
+                return resp.key, None
+            return resp.key, self.parseRpbGetResp(resp)
+
         ret = self.__put(robj, w, dw, pw,
                          return_body=return_body, if_none_match=if_none_match)
-        if return_body:
-            return ret
-        else:
-            return (ret[0], None, None)
+        return ret.addCallback(stored)
 
     @defer.inlineCallbacks
     def __put(self, robj, w=None, dw=None, pw=None, return_body=True,
@@ -233,8 +539,13 @@ class PBCTransport(transport.FeatureDetection):
         # vclock
         vclock = robj.vclock() or None
 
+        value = robj.get_encoded_data()
+        if IBodyProducer.providedBy(value) or hasattr(value, 'read'):
+            # protocol buffers need the whole value in memory anyway
+            value = yield self._readBody(value)
+
         payload = {
-                'value': robj.get_encoded_data(),
+                'value': value,
                 'content_type': robj.get_content_type(),
             }
 
@@ -269,21 +580,59 @@ class PBCTransport(transport.FeatureDetection):
                                       vclock,
                                       **kwargs
                                       )
-        defer.returnValue(self.parseRpbGetResp(ret))
+        defer.returnValue(ret)
+
+    @defer.inlineCallbacks
+    def _readBody(self, body):
+        """
+        read a file-like object or an IBodyProducer into a string
+        """
+        if not IBodyProducer.providedBy(body):
+            body = FileBodyProducer(body)
+        consumer = StringConsumer()
+        yield body.startProducing(consumer)
+        defer.returnValue(consumer.value())
 
     @defer.inlineCallbacks
-    def get(self, robj, r=None, pr=None, vtag=None):
+    def get(self, robj, r=None, pr=None, vtag=None, if_modified=None):
 
         # ***FIXME*** whats vtag for? ignored for now
 
+        kwargs = {}
+        if if_modified is not None:
+            kwargs['if_modified'] = if_modified[0]
+
         with (yield self._getFreeTransport()) as transport:
             ret = yield transport.get(robj.get_bucket().get_name(),
                                       robj.get_key(),
                                       r=r,
-                                      pr=pr)
+                                      pr=pr,
+                                      **kwargs)
 
+        if ret is not True and ret.unchanged:
+            defer.returnValue(UNCHANGED)
         defer.returnValue(self.parseRpbGetResp(ret))
 
+    @defer.inlineCallbacks
+    def stream_get(self, robj, consumer, r=None, pr=None, vtag=None):
+        """
+        Riak sends the whole value in a single message over PBC, but it is
+        still handed to consumer piecewise, honouring pauseProducing().
+        Siblings are returned without writing anything.
+        """
+        ret = yield self.get(robj, r=r, pr=pr, vtag=vtag)
+        if ret is None or len(ret[1]) != 1:
+            defer.returnValue(ret)
+
+        vclock, [(metadata, data)] = ret
+        producer = FileBodyProducer(StringIO(data))
+        consumer.registerProducer(producer, True)
+        try:
+            yield producer.startProducing(consumer)
+        finally:
+            consumer.unregisterProducer()
+        defer.returnValue((vclock, [(metadata, '')]))
+
     @defer.inlineCallbacks
     def head(self, robj, r=None, pr=None, vtag=None):
         with (yield self._getFreeTransport()) as transport:
@@ -323,13 +672,6 @@ class PBCTransport(transport.FeatureDetection):
             ret = yield transport.getBuckets()
         defer.returnValue([x for x in ret.buckets])
 
-    @defer.inlineCallbacks
-    def server_version(self):
-        if not self._s_version:
-            self._s_version = yield self._server_version()
-
-        defer.returnValue(LooseVersion(self._s_version))
-
     @defer.inlineCallbacks
     def _server_version(self):
         with (yield self._getFreeTransport()) as transport:
@@ -381,12 +723,110 @@ class PBCTransport(transport.FeatureDetection):
             ret = yield transport.getKeys(bucket.get_name())
         defer.returnValue(ret)
 
+    @defer.inlineCallbacks
+    def stream_keys(self, bucket, callback):
+        with (yield self._getFreeTransport()) as transport:
+            yield transport.streamKeys(bucket.get_name(), callback)
+
+    @defer.inlineCallbacks
+    def mapred(self, inputs, query, timeout=None):
+        """
+        Run a MapReduce query. Like over HTTP, the result is the list of
+        results of the kept phase, or a list of those lists if several
+        phases are kept.
+        """
+        results = {}
+
+        def collect(phase, data):
+            results.setdefault(phase, []).extend(data)
+
+        yield self.stream_mapred(inputs, query, collect, timeout)
+
+        if not query:
+            # without phases Riak returns the inputs, as phase 0
+            defer.returnValue(results.get(0, []))
+        kept = [i for i, phase in enumerate(query)
+                if phase.values()[0].get('keep')]
+        if len(kept) == 1:
+            defer.returnValue(results.get(kept[0], []))
+        defer.returnValue([results.get(i, []) for i in kept])
+
+    @defer.inlineCallbacks
+    def stream_mapred(self, inputs, query, callback, timeout=None):
+        """
+        Run a MapReduce query, calling callback with (phase, results) for
+        every chunk of results Riak sends.
+        """
+        plm = yield self.phaseless_mapred()
+        if not plm and (query is None or len(query) is 0):
+            raise Exception('Phase-less MapReduce is not supported '
+                            'by this Riak node')
+
+        # Construct the job, optionally set the timeout...
+        job = {'inputs': inputs, 'query': query or []}
+        if timeout is not None:
+            job['timeout'] = timeout
+
+        content = self.encodeJson(job)
+
+        def gotChunk((phase, response)):
+            return callback(phase, self.decodeJson(response))
+
+        with (yield self._getFreeTransport()) as transport:
+            yield transport.mapReduce(content, 'application/json', gotChunk)
+
     @defer.inlineCallbacks
     def get_index(self, bucket, index, startkey, endkey=None):
         with (yield self._getFreeTransport()) as transport:
             ret = yield transport.get_index(bucket, index, startkey, endkey=endkey)
         defer.returnValue(ret)
 
+    @defer.inlineCallbacks
+    def index_page(self, bucket, index, startkey, endkey=None,
+                   return_terms=False, max_results=None, continuation=None):
+        """
+        Query a page of a secondary index, returns (results, continuation)
+        """
+        yield self._check_paginated_indexes()
+        with (yield self._getFreeTransport()) as transport:
+            resp = yield transport.getIndexPage(
+                bucket, index, startkey, endkey, return_terms, max_results,
+                continuation)
+        defer.returnValue((self._indexResults(resp),
+                           resp.continuation or None))
+
+    @defer.inlineCallbacks
+    def stream_index(self, bucket, callback, index, startkey, endkey=None,
+                     return_terms=False, max_results=None, continuation=None):
+        """
+        Query a secondary index, calling callback with every chunk of
+        results Riak sends. Returns the continuation.
+        """
+        yield self._check_paginated_indexes()
+        last = [None]
+
+        def gotChunk(resp):
+            if resp.continuation:
+                last[0] = resp.continuation
+            results = self._indexResults(resp)
+            if results:
+                return callback(results)
+
+        with (yield self._getFreeTransport()) as transport:
+            yield transport.streamIndex(
+                bucket, index, startkey, endkey, gotChunk, return_terms,
+                max_results, continuation)
+        defer.returnValue(last[0])
+
+    def _indexResults(self, resp):
+        """
+        the keys of a RpbIndexResp, or its (term, key) pairs if terms were
+        requested
+        """
+        if len(resp.results):
+            return [(pair.key, pair.value) for pair in resp.results]
+        return list(resp.keys)
+
     def parseRpbGetResp(self, res):
         """
         adaptor for a RpbGetResp message
@@ -402,8 +842,14 @@ class PBCTransport(transport.FeatureDetection):
         resList = []
         for content in res.content:
             # iterate over RpbContent field
-            metadata = {MD_USERMETA: {}, MD_INDEX: []}
             data = content.value
+            if len(content.links) or len(content.usermeta) or \
+                    len(content.indexes):
+                # built when first used
+                metadata = LazyMetadata(self._contentLoader(content))
+            else:
+                metadata = {MD_USERMETA: {}, MD_INDEX: []}
+
             if content.HasField('content_type'):
                 metadata[MD_CTYPE] = content.content_type
 
@@ -419,28 +865,33 @@ class PBCTransport(transport.FeatureDetection):
             if content.HasField('last_mod'):
                 metadata[MD_LASTMOD] = content.last_mod
 
+            if content.HasField('last_mod_usecs'):
+                metadata[MD_LASTMOD_USECS] = content.last_mod_usecs
+
             if content.HasField('deleted'):
                 metadata[MD_DELETED] = content.deleted
 
-            if len(content.links):
-                metadata[MD_LINKS] = []
-                for l in content.links:
-                    metadata[MD_LINKS].append(
-                        RiakLink(l.bucket, l.key, l.tag)
-                    )
-
-            if len(content.usermeta):
-                metadata[MD_USERMETA] = {}
-                for md in content.usermeta:
-                    metadata[MD_USERMETA][md.key] = md.value
-
-            if len(content.indexes):
-                metadata[MD_INDEX] = []
-                for ie in content.indexes:
-                    metadata[MD_INDEX].append(RiakIndexEntry(ie.key, ie.value))
             resList.append((metadata, data))
         return vclock, resList
 
+    @staticmethod
+    def _contentLoader(content):
+        """
+        the links, user metadata and indexes of a RpbContent, for
+        LazyMetadata
+        """
+        def load():
+            metadata = {MD_USERMETA: {}, MD_INDEX: []}
+            if len(content.links):
+                metadata[MD_LINKS] = [RiakLink(l.bucket, l.key, l.tag)
+                                      for l in content.links]
+            for md in content.usermeta:
+                metadata[MD_USERMETA][md.key] = md.value
+            for ie in content.indexes:
+                metadata[MD_INDEX].append(RiakIndexEntry(ie.key, ie.value))
+            return metadata
+        return load
+
     def decodeJson(self, s):
         return self.client.get_decoder('application/json')(s)
 
@@ -1,6 +1,9 @@
+import time
+
 from zope.interface import Interface
 
 from twisted.internet import defer
+from twisted.python import failure
 
 from distutils.version import LooseVersion
 
@@ -9,6 +12,7 @@ versions = {
     1.1: LooseVersion("1.1.0"),
     1.2: LooseVersion("1.2.0"),
     1.3: LooseVersion("1.3.0"),
+    1.4: LooseVersion("1.4.0"),
     }
 
 
@@ -18,6 +22,13 @@ class ITransport(Interface):
         list keys for a given bucket
         """
 
+    def stream_keys(self, bucket, callback):
+        """
+        list keys for a given bucket, calling callback with every chunk of
+        keys as it arrives. If callback returns a deferred, reading is
+        paused until it fires.
+        """
+
     def put(self, robj, w=None, dw=None, pw=None, return_body=True,
             if_none_match=False):
         """
@@ -27,7 +38,8 @@ class ITransport(Interface):
     def put_new(self, robj, w=None, dw=None, pw=None, return_body=True,
                 if_none_match=False):
         """
-        store a riak_object and generate a key for it
+        store a riak_object and generate a key for it, returns
+        (key, result) where result is what put() returns
         """
 
     def get(self, robj, r=None, pr=None, vtag=None):
@@ -35,12 +47,53 @@ class ITransport(Interface):
         fetch a key from the server
         """
 
+    def stream_get(self, robj, consumer, r=None, pr=None, vtag=None):
+        """
+        fetch a key from the server, writing its value to an IConsumer
+        instead of returning it
+        """
+
     def delete(self, robj, rw=None, r=None, w=None, dw=None, pr=None,
                pw=None):
         """
         delete a key from the bucket
         """
 
+    def mapred(self, inputs, query, timeout=None):
+        """
+        run a MapReduce query and return its results
+        """
+
+    def stream_mapred(self, inputs, query, callback, timeout=None):
+        """
+        run a MapReduce query, calling callback with (phase, results) for
+        every chunk of results as it arrives. If callback returns a
+        deferred, reading is paused until it fires.
+        """
+
+    def get_index(self, bucket, index, startkey, endkey=None):
+        """
+        query a secondary index, returning the matching keys
+        """
+
+    def index_page(self, bucket, index, startkey, endkey=None,
+                   return_terms=False, max_results=None, continuation=None):
+        """
+        query a secondary index for at most max_results keys, or (term,
+        key) pairs if return_terms is set, starting where continuation
+        says. Returns (results, continuation), the continuation is None
+        on the last page
+        """
+
+    def stream_index(self, bucket, callback, index, startkey, endkey=None,
+                     return_terms=False, max_results=None, continuation=None):
+        """
+        like index_page, but calling callback with every chunk of results
+        as it arrives instead of collecting them. If callback returns a
+        deferred, reading is paused until it fires. Returns the
+        continuation
+        """
+
     def server_version(self):
         """
         return cached server version
@@ -72,9 +125,72 @@ class ITransport(Interface):
         get bucket properties
         """
 
+    def get(self, robj, r=None, pr=None, vtag=None, if_modified=None):
+        """
+        fetch an object. if_modified is the ``(vclock, vtag)`` of a copy
+        the caller holds, riakasaurus.cache.UNCHANGED is returned if it is
+        still current
+        """
+
+    def pool_stats(self):
+        """
+        return connection pool counters
+        """
+
+    def quit(self):
+        """
+        close all connections held by the transport
+        """
+
 
 class FeatureDetection(object):
+    """
+    Capability checks based on the Riak version of the server. The version
+    is fetched once and shared by all concurrent callers; it is refreshed
+    after SERVER_VERSION_TTL seconds, or never if that is None.
+    """
+    SERVER_VERSION_TTL = None
+
     _s_version = None
+    _s_version_expires = None
+    _s_version_waiting = None
+
+    def set_server_version(self, version):
+        """
+        Seed the server version, e.g. from configuration, so it never has
+        to be fetched from the server (until SERVER_VERSION_TTL expires).
+        """
+        if not isinstance(version, LooseVersion):
+            version = LooseVersion(version)
+        self._s_version = version
+        if self.SERVER_VERSION_TTL is None:
+            self._s_version_expires = None
+        else:
+            self._s_version_expires = time.time() + self.SERVER_VERSION_TTL
+
+    def refresh_server_version(self):
+        """
+        Fetch the server version again, e.g. after a rolling upgrade.
+        Concurrent refreshes share one request.
+        :rtype deferred firing with a LooseVersion
+        """
+        d = defer.Deferred()
+        if self._s_version_waiting is not None:
+            self._s_version_waiting.append(d)
+            return d
+
+        self._s_version_waiting = [d]
+
+        def done(result):
+            waiting, self._s_version_waiting = self._s_version_waiting, None
+            if not isinstance(result, failure.Failure):
+                self.set_server_version(result)
+                result = self._s_version
+            for d in waiting:
+                d.callback(result)
+
+        defer.maybeDeferred(self._server_version).addBoth(done)
+        return d
 
     def _server_version(self):
         """
@@ -113,6 +229,24 @@ class FeatureDetection(object):
         d = yield self.server_version()
         defer.returnValue(d >= versions[1.2])
 
+    @defer.inlineCallbacks
+    def paginated_indexes(self):
+        """
+        Whether secondary index queries can be paginated, return terms
+        and be streamed
+
+        :rtype bool
+        """
+        d = yield self.server_version()
+        defer.returnValue(d >= versions[1.4])
+
+    @defer.inlineCallbacks
+    def _check_paginated_indexes(self):
+        paginated = yield self.paginated_indexes()
+        if not paginated:
+            raise Exception('Paginated and streamed secondary index '
+                            'queries are not supported by this Riak node')
+
     @defer.inlineCallbacks
     def pb_search(self):
         """
@@ -161,9 +295,14 @@ class FeatureDetection(object):
         d = yield self.server_version()
         defer.returnValue(d >= versions[1])
 
-    @defer.inlineCallbacks
     def server_version(self):
-        if not self._s_version:
-            self._s_version = yield self._server_version()
-
-        defer.returnValue(LooseVersion(self._s_version))
+        """
+        The version of the server, only fetched if it is not known yet or
+        has expired.
+        :rtype deferred firing with a LooseVersion
+        """
+        if self._s_version is not None and (
+                self._s_version_expires is None or
+                self._s_version_expires > time.time()):
+            return defer.succeed(self._s_version)
+        return self.refresh_server_version()